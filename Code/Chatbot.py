@@ -1,10 +1,18 @@
+from contextlib import nullcontext
 import numpy as np
 from tensorflow.keras.layers import LSTM
 from tensorflow.keras.models import Sequential, Model
-from tensorflow.keras.layers import Input, Activation, Dense, Permute, Dropout, Embedding
+from tensorflow.keras.layers import Input, Activation, Dense, Permute, Dropout, Embedding, GlobalAveragePooling1D
 from tensorflow.keras.layers import add, dot, concatenate
-from helpers import get_hyperparameters, create_word_indexes, affine_answer
-from data_processing import get_stories, transform_entry, vectorization
+from helpers import DatasetStatistics, create_word_indexes, get_vocabulary_hash, get_configuration_hash, \
+    affine_answer
+from data_processing import iter_stories, transform_entry, vectorization, vectorization_sentences
+from CompactDataset import CompactDataset
+from distribution import is_chief, to_sharded_dataset
+from checkpointing import AsyncCheckpoint, latest_checkpoint, restore_checkpoint, run_directory
+from layers import NilEmbedding, PositionEncoding, SharedEmbedding, SlotAttention
+from profiling import EpochProfiler, tensorflow_trace
+from inference import InferenceSession, format_predictions
 
 
 class Chatbot:
@@ -15,12 +23,38 @@ class Chatbot:
     initializes embedding layers and builds a memory-based neural network
     for predicting answers to questions based on short stories.
 
+    Two architectures are available:
+        - "flat": the story is one token sequence and attention runs between story
+          tokens and question tokens before an LSTM (original model).
+        - "sentence": each sentence of the story is encoded into one memory slot with
+          position encoding and attention runs over the slots, so the cost grows with
+          the number of facts instead of the number of tokens. Only the last
+          `memory_size` sentences are kept (sliding window).
+
+    With `weight_tying`, the embedding tables are shared as in the MemN2N weight tying
+    (the network has a single hop, so the schemes reduce to):
+        - "adjacent": the question embedding is the input memory one (B = A).
+        - "layerwise": the output memory embedding is shared too (A = B = C), when its size
+          matches (always for the sentence architecture, for the flat one only if
+          `query_maxlength` equals `embedding_dim`).
+    In both cases the output layer is the transposed question embedding when the answer
+    vector has `embedding_dim` values and the outputs cover the vocabulary.
+
     Attributes:
-        train (list): Preprocessed training data in story-question-answer format.
-        test (list): Preprocessed test data in story-question-answer format.
+        train (CompactDataset): Preprocessed training data in story-question-answer format.
+        test (CompactDataset): Preprocessed test data in story-question-answer format.
         embedding_dim (int): Dimension of the word embeddings.
         dropout_proportion (float): Dropout rate used in the embedding and LSTM layers.
         cells_nb (int): Number of LSTM cells used in the model.
+        architecture (str): "flat" or "sentence".
+        memory_size (int): Number of memory slots of the sentence architecture.
+        length_percentile (float): Percentile of the story lengths used as padding length.
+        vocab_size (int): Size of the vocabulary, including the padding index 0.
+        answer_head (bool): Whether the output layer covers the answers only.
+        weight_tying (str): None, "adjacent" or "layerwise".
+        output_words (list): Word of each output of the network (the vocabulary or the answers).
+        statistics (DatasetStatistics): Vocabulary and length statistics of the datasets.
+        profiler (StageProfiler): Profiler of the training pipeline, or None.
         network (keras.Model): Compiled Keras model ready for training or evaluation.
     """
     train = None
@@ -28,9 +62,25 @@ class Chatbot:
     embedding_dim = None
     dropout_proportion = None
     cells_nb = None
+    architecture = None
+    memory_size = None
+    length_percentile = None
+    vocab_size = None
+    answer_head = None
+    weight_tying = None
+    output_words = None
+    output_indexes = None
+    statistics = None
+    profiler = None
+    __inference_network = None
+    __inference_source = None
+    __story_networks = None
+    __story_source = None
     network = None
 
-    def __init__(self, path_textfiles, embedding_dim=64, dropout_proportion=0.3, cells_nb=32):
+    def __init__(self, path_textfiles, embedding_dim=64, dropout_proportion=0.3, cells_nb=32,
+                 architecture='flat', memory_size=50, length_percentile=100, answer_head=False, weight_tying=None,
+                 profiler=None):
         """
        Initializes the Chatbot by loading data, setting hyperparameters,
        creating embeddings, and building the model.
@@ -41,29 +91,200 @@ class Chatbot:
                                  formatting with 'train' and 'test' respectively.
            embedding_dim (int, optional): Size of the word embedding vectors. Defaults to 64.
            dropout_proportion (float, optional): Dropout rate for regularization. Defaults to 0.3.
-           cells_nb (int, optional): Number of units in the LSTM layer. Defaults to 32.
+           cells_nb (int, optional): Number of units in the LSTM layer, 0 to replace the LSTM by an
+                                     average over the question positions. Defaults to 32.
+           architecture (str, optional): "flat" or "sentence". Defaults to "flat".
+           memory_size (int, optional): Maximum number of memory slots (sentences) of the
+                                        sentence architecture. Defaults to 50.
+           length_percentile (float, optional): Percentile of the story lengths (tokens for the flat
+                                                architecture, sentences for the sentence one) used
+                                                as padding length; longer stories keep their most
+                                                recent part. Defaults to 100 (no truncation).
+           answer_head (bool, optional): If True, the output layer scores only the answers seen in
+                                         the datasets instead of the whole vocabulary, which shrinks
+                                         the largest matrix product, the softmax and the targets.
+                                         Defaults to False.
+           weight_tying (str, optional): None (independent embeddings), "adjacent" or "layerwise",
+                                         see above. Defaults to None.
+           profiler (StageProfiler, optional): Records the resources used by each stage of the
+                                               construction and of `train_model` (see `profiling.py`).
+                                               Defaults to None.
+
+        Raises:
+            ValueError: If the architecture or the weight tying is unknown.
         """
+        if architecture not in ('flat', 'sentence'):
+            raise ValueError(f"Unknown architecture: {architecture}")
+        if weight_tying not in (None, 'adjacent', 'layerwise'):
+            raise ValueError(f"Unknown weight tying: {weight_tying}")
+
         self.embedding_dim = embedding_dim
         self.dropout_proportion = dropout_proportion
         self.cells_nb = cells_nb
+        self.architecture = architecture
+        self.length_percentile = length_percentile
+        self.answer_head = answer_head
+        self.weight_tying = weight_tying
+        self.profiler = profiler
+
+        # vocabulary and lengths are collected while parsing, in a single pass
+        self.statistics = DatasetStatistics()
+        self.train = self.__load(path_textfiles.format('train'), 'train')
+        self.test = self.__load(path_textfiles.format('test'), 'test')
+
+        with self.__stage('vocabulary'):
+            self.__set_lengths(memory_size, length_percentile)
+            # Reserve 0 for masking via pad_sequences
+            self.set_vocabulary([''] + self.statistics.vocabulary())
+
+        with self.__stage('build network'):
+            self.network = self.__build_network()
+
+    def __stage(self, name):
+        """Returns the context profiling a stage, or a no-op context without profiler."""
+        return self.profiler.stage(name) if self.profiler is not None else nullcontext()
+
+    def __load(self, url, name):
+        """
+        Loads a bAbI file into a compact dataset, collecting the statistics.
+
+        The file is streamed, except when profiling: it is then read at once so that the
+        reading and the parsing are measured separately.
+
+        Args:
+            url (str): Path to the bAbI dataset text file.
+            name (str): Name of the dataset in the profiling stages.
+
+        Returns:
+            CompactDataset: The dataset.
+        """
+        if self.profiler is None:
+            return CompactDataset.from_file(url, stats=self.statistics)
+
+        with self.__stage(f'read {name}'):
+            with open(url, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        with self.__stage(f'parse {name}'):
+            return CompactDataset.from_samples(iter_stories(lines, self.statistics))
+
+    def __set_lengths(self, memory_size, length_percentile):
+        """Sets the padding lengths from the dataset statistics."""
+        self.query_maxlength = self.statistics.query_maxlength()
+        if self.architecture == 'flat':
+            self.story_maxlength = self.statistics.story_maxlength(length_percentile)
+        else:
+            self.sentence_maxlength = self.statistics.sentence_maxlength()
+            self.memory_size = min(memory_size, self.statistics.memory_maxlength(length_percentile))
+
+    def get_hyperparameters(self):
+        """
+        Returns the constructor arguments needed to rebuild the same network, saved with each model.
+
+        Returns:
+            dict: The embedding size, dropout rate, number of LSTM cells, weight tying, length
+                  percentile and, for the sentence architecture, the number of memory slots.
+        """
+        hyperparameters = {'embedding_dim': self.embedding_dim, 'dropout_proportion': self.dropout_proportion,
+                           'cells_nb': self.cells_nb, 'weight_tying': self.weight_tying,
+                           'length_percentile': self.length_percentile}
+        if self.architecture == 'sentence':
+            hyperparameters['memory_size'] = self.memory_size
+        return hyperparameters
+
+    def get_run_id(self):
+        """
+        Identifies the training runs whose checkpoints can be restored into the current network.
+
+        The identifier covers everything that defines the shapes of the weights: the
+        architecture, the hyperparameters (including the weight tying), the answer head,
+        the padding lengths, the number of outputs and the vocabulary.
+
+        Returns:
+            str: "<architecture>-<configuration hash>-<vocabulary hash>".
+        """
+        configuration = dict(self.get_hyperparameters(), architecture=self.architecture,
+                             answer_head=self.answer_head, outputs=len(self.output_words),
+                             inputs=[list(tensor.shape[1:]) for tensor in self.network.inputs])
+        return f"{self.architecture}-{get_configuration_hash(configuration)}-{get_vocabulary_hash(self.word_indexes)}"
+
+    def set_network(self, network):
+        """
+        Replaces the network by a loaded one, taking the padding lengths from its inputs.
+
+        A saved network keeps the lengths it was trained with, which may differ from the
+        ones of the current datasets (other percentile, models saved before it was recorded).
 
-        self.train = get_stories(path_textfiles.format('train'))
-        self.test = get_stories(path_textfiles.format('test'))
+        Args:
+            network (keras.Model): The network, with the input shapes of `architecture`.
+        """
+        story, question = (tuple(tensor.shape[1:]) for tensor in network.inputs)
+        if self.architecture == 'sentence':
+            self.memory_size, self.sentence_maxlength = story
+        else:
+            self.story_maxlength, = story
+        self.query_maxlength, = question
+        self.network = network
+
+    def set_vocabulary(self, index_words, output_words=None):
+        """
+        Sets the vocabulary of the chatbot and translates its datasets to the new indexes.
 
-        vocab, self.story_maxlength, self.query_maxlength = get_hyperparameters(self.train, self.test)
+        Used at construction with the sorted vocabulary of the datasets, and by `Model.load`
+        with the vocabulary saved along a network that was fine-tuned on new words.
 
-        # Reserve 0 for masking via pad_sequences
-        vocab_size = len(vocab) + 1
+        Args:
+            index_words (list of str): Word of each index, index 0 being the padding ('').
+            output_words (list of str, optional): Answer of each output of the answer head.
+                                                  Defaults to None (sorted answers of the datasets).
 
-        self.word_indexes = create_word_indexes(vocab)
+        Raises:
+            KeyError: If a word of the training or test dataset is missing from the vocabulary.
+        """
+        self.vocab_size = len(index_words)
+        self.index_words = list(index_words)
+        self.word_indexes = create_word_indexes(self.index_words[1:])
+
+        if self.answer_head:
+            self.output_words = list(output_words) if output_words is not None else sorted(self.statistics.answers)
+            # the answer head has no padding output
+            self.output_indexes = {word: index for index, word in enumerate(self.output_words)}
+        else:
+            self.output_words = self.index_words
+            self.output_indexes = None
+
+        self.train.reindex(self.word_indexes)
+        self.test.reindex(self.word_indexes)
+
+    def __build_network(self):
+        """
+        Creates the embedding layers and assembles the memory network from them.
 
-        # Création des embeddings
-        self.embedding_u = self.__build_embedding_u(vocab_size)
-        self.embedding_m = self.__build_embedding_m(vocab_size)
-        self.embedding_c = self.__build_embedding_c(vocab_size)
+        Called from the constructor, by `train_model` when the variables have to be
+        created inside a distribution strategy scope, and by `extend_vocabulary`.
+
+        Returns:
+            keras.Model: The (uncompiled) memory network.
+        """
+        self.output_embedding = None
+        if self.weight_tying is not None:
+            self.__build_tied_embeddings(self.vocab_size)
+        else:
+            # Création des embeddings
+            self.embedding_u = self.__build_embedding_u(self.vocab_size)
+            self.embedding_m = self.__build_embedding_m(self.vocab_size)
+            self.embedding_c = self.__build_embedding_c(self.vocab_size)
 
         # build the final model
-        self.network = self.__create_model(vocab_size)
+        if self.architecture == 'sentence':
+            return self.__create_sentence_model(self.vocab_size)
+        return self.__create_model(self.vocab_size)
+
+    def __nil_constraint(self):
+        """
+        Returns the constraint of the embedding tables: for the sentence architecture, the
+        padding index 0 is kept at zero so that padding words and empty slots carry nothing.
+        """
+        return NilEmbedding() if self.architecture == 'sentence' else None
 
     def __build_embedding_u(self, vocab_size):
         """
@@ -78,9 +299,9 @@ class Chatbot:
         Returns:
             keras.Sequential: Embedding model for the question input.
         """
-        model = Sequential()
+        model = Sequential(name='encoded_u')
         model.add(Embedding(input_dim=vocab_size, output_dim=self.embedding_dim,
-                            input_length=self.query_maxlength))
+                            input_length=self.query_maxlength, embeddings_constraint=self.__nil_constraint()))
         model.add(Dropout(self.dropout_proportion))
         return model
 
@@ -97,8 +318,9 @@ class Chatbot:
         Returns:
             keras.Sequential: Embedding model for memory encoding (m).
         """
-        model = Sequential()
-        model.add(Embedding(input_dim=vocab_size, output_dim=self.embedding_dim))
+        model = Sequential(name='encoded_m')
+        model.add(Embedding(input_dim=vocab_size, output_dim=self.embedding_dim,
+                            embeddings_constraint=self.__nil_constraint()))
         model.add(Dropout(self.dropout_proportion))
         return model
 
@@ -108,7 +330,8 @@ class Chatbot:
 
         Unlike the other embeddings, this one maps story words into vectors
         of size `query_maxlength`, so that the response can be aligned with
-        the question encoding during attention.
+        the question encoding during attention. The sentence architecture sums
+        the output memory with the question, so it uses `embedding_dim` instead.
 
         Args:
             vocab_size (int): Size of the vocabulary (including padding).
@@ -116,11 +339,59 @@ class Chatbot:
         Returns:
             keras.Sequential: Embedding model for contextual memory encoding (c).
         """
-        model = Sequential()
-        model.add(Embedding(input_dim=vocab_size, output_dim=self.query_maxlength))
+        output_dim = self.embedding_dim if self.architecture == 'sentence' else self.query_maxlength
+
+        model = Sequential(name='encoded_c')
+        model.add(Embedding(input_dim=vocab_size, output_dim=output_dim, embeddings_constraint=self.__nil_constraint()))
         model.add(Dropout(self.dropout_proportion))
         return model
 
+    def __build_tied_embeddings(self, vocab_size):
+        """
+        Builds the embeddings sharing their tables according to `weight_tying`.
+
+        The shared tables are used directly in the network graph (not inside `Sequential`
+        models), so that they are restored shared by `model_from_json`. Sets the
+        `output_embedding` used by `__build_output` when the output layer can be tied.
+
+        Args:
+            vocab_size (int): Size of the vocabulary (including padding).
+        """
+        def encoder(embedding, name):
+            # the dropout, created at the single call of the encoder, names its output like the untied encoders
+            return lambda inputs: Dropout(self.dropout_proportion, name=name)(embedding(inputs))
+
+        shared = SharedEmbedding(vocab_size, self.embedding_dim, embeddings_constraint=self.__nil_constraint(),
+                                 name='shared_embedding')
+        self.embedding_u = encoder(shared, 'encoded_u')
+        self.embedding_m = encoder(shared, 'encoded_m')
+
+        c_dim = self.embedding_dim if self.architecture == 'sentence' else self.query_maxlength
+        if self.weight_tying == 'layerwise' and c_dim == self.embedding_dim:
+            self.embedding_c = encoder(shared, 'encoded_c')
+        else:
+            self.embedding_c = encoder(SharedEmbedding(vocab_size, c_dim, embeddings_constraint=self.__nil_constraint(),
+                                                       name='embedding_c'), 'encoded_c')
+
+        # the output is tied when the answer vector can be scored against the question embeddings
+        answer_dim = self.embedding_dim if self.architecture == 'sentence' else self.cells_nb
+        if not self.answer_head and answer_dim == self.embedding_dim:
+            self.output_embedding = shared
+
+    def __build_output(self, answer):
+        """
+        Projects the answer vector onto the outputs, with the tied embedding if there is one.
+
+        Args:
+            answer (KerasTensor): The answer representation.
+
+        Returns:
+            KerasTensor: The logits of the outputs.
+        """
+        if self.output_embedding is not None:
+            return self.output_embedding(answer, reverse=True)
+        return Dense(len(self.output_words))(answer)
+
     def __create_model(self, vocab_size):
         """
         Builds the memory network model based on the architecture described in
@@ -129,7 +400,8 @@ class Chatbot:
         The model takes a story and a question as input, encodes them using
         embedding layers, applies an attention mechanism to compute relevance
         between the story and the question, and outputs a probability distribution
-        over the vocabulary representing the predicted answer.
+        over the vocabulary (or over the answers with `answer_head`) representing the
+        predicted answer.
 
         Args:
             vocab_size (int): Total size of the vocabulary, including padding.
@@ -151,7 +423,7 @@ class Chatbot:
 
         # Compute attention weights between memory and question embeddings
         probabilities = dot([input_encoded_m, question_encoded], axes=(2, 2))
-        probabilities = Activation('softmax')(probabilities)
+        probabilities = Activation('softmax', name='attention')(probabilities)
 
         # Use attention weights to combine with contextual memory embedding
         response = add([probabilities, input_encoded_c])
@@ -163,20 +435,90 @@ class Chatbot:
         answer = concatenate([response, question_encoded])
 
         # Process the combined vector through LSTM to generate a final answer representation
-        answer = LSTM(self.cells_nb)(answer)
+        if self.cells_nb:
+            answer = LSTM(self.cells_nb)(answer)
+        else:
+            # lighter variant without recurrence (e.g. for a distilled student); pooling keeps the
+            # output layer as narrow as the LSTM's, where flattening would multiply its inputs
+            answer = GlobalAveragePooling1D()(answer)
 
         # Apply dropout for regularization
         answer = Dropout(self.dropout_proportion)(answer)
 
-        # Final dense layer projecting to the vocabulary size
-        answer = Dense(vocab_size)(answer)
+        # Final layer projecting to the vocabulary size (or to the answers), tied to the question embedding if possible
+        answer = self.__build_output(answer)
 
-        # Softmax activation to produce a probability distribution over the vocabulary
+        # Softmax activation to produce a probability distribution over the vocabulary (or the answers)
         answer = Activation('softmax')(answer)
 
         return Model([input_sequence, question], answer)
 
-    def train_model(self):
+    def __create_sentence_model(self, vocab_size):
+        """
+        Builds the sentence-level memory network ("End-To-End Memory Networks", single hop).
+
+        The story input has shape (memory_size, sentence_maxlength): every sentence is
+        embedded and reduced to one memory slot with position encoding, the question is
+        encoded the same way, and the attention is a softmax over the non-empty slots (the
+        padding embedding stays at zero). The weighted sum of the output memory is added to
+        the question encoding and projected onto the vocabulary (or the answers with `answer_head`).
+
+        Args:
+            vocab_size (int): Total size of the vocabulary, including padding.
+
+        Returns:
+            keras.Model: The sentence-level memory network.
+        """
+        input_sentences = Input((self.memory_size, self.sentence_maxlength))
+        question = Input((self.query_maxlength,))
+
+        # one vector per sentence: (memory_size, embedding_dim)
+        memory_m = PositionEncoding(name='memory_m')(self.embedding_m(input_sentences))
+        memory_c = PositionEncoding(name='memory_c')(self.embedding_c(input_sentences))
+
+        # one vector for the question: (embedding_dim,)
+        question_encoded = PositionEncoding()(self.embedding_u(question))
+
+        # attention over the memory slots, empty slots excluded: (memory_size,)
+        probabilities = dot([memory_m, question_encoded], axes=(2, 1))
+        probabilities = SlotAttention(name='attention')([probabilities, input_sentences])
+
+        # weighted sum of the output memory: (embedding_dim,)
+        response = dot([probabilities, memory_c], axes=(1, 1))
+
+        answer = add([response, question_encoded])
+        answer = Dropout(self.dropout_proportion)(answer)
+        answer = self.__build_output(answer)
+        answer = Activation('softmax')(answer)
+
+        return Model([input_sentences, question], answer)
+
+    def vectorize(self, data, entry=False):
+        """
+        Vectorizes samples with the function matching the architecture of the network.
+
+        Args:
+            data (CompactDataset or list): A dataset, or samples as returned by `transform_entry`.
+            entry (bool, optional): True if the samples carry no answer. Defaults to False.
+
+        Returns:
+            tuple: The story, query (and answer if entry=False) arrays.
+        """
+        if isinstance(data, CompactDataset):
+            if self.architecture == 'sentence':
+                return data.vectorize_sentences(self.memory_size, self.sentence_maxlength, self.query_maxlength,
+                                                entry=entry, answer_indexes=self.output_indexes)
+            return data.vectorize(self.story_maxlength, self.query_maxlength, entry=entry,
+                                  answer_indexes=self.output_indexes)
+
+        if self.architecture == 'sentence':
+            return vectorization_sentences(data, self.word_indexes, self.memory_size, self.sentence_maxlength,
+                                           self.query_maxlength, entry=entry, answer_indexes=self.output_indexes)
+        return vectorization(data, self.word_indexes, self.story_maxlength, self.query_maxlength, entry=entry,
+                             answer_indexes=self.output_indexes)
+
+    def train_model(self, strategy=None, batch_size=32, epochs=120, checkpoint_dir=None, checkpoint_every=1,
+                    checkpoint_keep=3, tf_profile_dir=None):
         """
         Vectorizes the training and test data, compiles the model, and trains it.
 
@@ -185,20 +527,274 @@ class Chatbot:
         - Compiles the memory network with RMSprop optimizer and categorical crossentropy loss.
         - Trains the model on the training set for a fixed number of epochs.
         - Evaluates performance using a validation set during training.
+
+        When a `tf.distribute` strategy is given (see `distribution.get_strategy`), the network
+        is rebuilt inside the strategy scope so its variables are replicated, the global batch
+        size becomes `batch_size` times the number of replicas, and the data is fed through
+        `tf.data` datasets sharded before shuffling, so that each worker trains on its own part.
+
+        When a checkpoint directory is given, the weights, optimizer state and epoch counter are
+        saved periodically by a background thread (see `checkpointing.AsyncCheckpoint`), and a run
+        interrupted with the same vocabulary and architecture resumes from its latest checkpoint.
+
+        Args:
+            strategy (tf.distribute.Strategy, optional): Strategy used for data-parallel training.
+                                                         Defaults to None (single device).
+            batch_size (int, optional): Batch size per replica. Defaults to 32.
+            epochs (int, optional): Number of training epochs. Defaults to 120.
+            checkpoint_dir (str, optional): Directory of the training checkpoints (one subdirectory
+                                            per run, see `get_run_id`). Defaults to None (disabled).
+            checkpoint_every (int, optional): Number of epochs between two checkpoints. Defaults to 1.
+            checkpoint_keep (int, optional): Number of checkpoints kept on disk. Defaults to 3.
+            tf_profile_dir (str, optional): Directory of a TensorFlow profiler trace of the fit loop,
+                                            viewable in TensorBoard. Defaults to None (disabled).
+
+        Returns:
+            keras.callbacks.History: The training history returned by `fit`.
         """
-        inputs_train, queries_train, answers_train = vectorization(self.train, self.word_indexes,
-                                                                   self.story_maxlength, self.query_maxlength)
-        inputs_test, queries_test, answers_test = vectorization(self.test, self.word_indexes,
-                                                                self.story_maxlength, self.query_maxlength)
+        with self.__stage('vectorization'):
+            inputs_train, queries_train, answers_train = self.vectorize(self.train)
+            inputs_test, queries_test, answers_test = self.vectorize(self.test)
+
+        if strategy is None:
+            # a fresh context is entered at each use (a strategy scope can only be entered once)
+            scope = nullcontext
+            # compile the model
+            with self.__stage('compile'):
+                self.network.compile(optimizer='rmsprop', loss='categorical_crossentropy', metrics=['accuracy'])
+            train_data = dict(x=[inputs_train, queries_train], y=answers_train, batch_size=batch_size)
+            validation_data = ([inputs_test, queries_test], answers_test)
+        else:
+            scope = strategy.scope
+            global_batch_size = batch_size * strategy.num_replicas_in_sync
+            dataset, steps = to_sharded_dataset(strategy, (inputs_train, queries_train), answers_train,
+                                                global_batch_size, shuffle=True)
+            validation_data, validation_steps = to_sharded_dataset(strategy, (inputs_test, queries_test), answers_test,
+                                                                   global_batch_size)
+            train_data = dict(x=dataset, steps_per_epoch=steps, validation_steps=validation_steps)
+
+            # variables (and the optimizer slots) must be created under the strategy scope
+            with scope(), self.__stage('compile'):
+                self.network = self.__build_network()
+                self.network.compile(optimizer='rmsprop', loss='categorical_crossentropy', metrics=['accuracy'])
+
+        initial_epoch = 0
+        callbacks = []
+        if checkpoint_dir is not None:
+            # checkpoints of another vocabulary or network configuration cannot be restored
+            run_id = self.get_run_id()
+            checkpoint_dir = run_directory(checkpoint_dir, run_id)
+
+            checkpoint = latest_checkpoint(checkpoint_dir, run_id)
+            if checkpoint is not None:
+                with scope():
+                    initial_epoch = restore_checkpoint(self.network, checkpoint)
+
+            if is_chief(strategy):
+                callbacks.append(AsyncCheckpoint(checkpoint_dir, run_id, every=checkpoint_every,
+                                                 keep=checkpoint_keep))
+
+        if self.profiler is not None:
+            callbacks.append(EpochProfiler(self.profiler))
 
-        # compile the model
-        self.network.compile(optimizer='rmsprop', loss='categorical_crossentropy', metrics=['accuracy'])
         # train
-        self.network.fit([inputs_train, queries_train], answers_train,
-                         batch_size=32, epochs=120,
-                         validation_data=([inputs_test, queries_test], answers_test))
+        with tensorflow_trace(tf_profile_dir):
+            return self.network.fit(**train_data, epochs=epochs, initial_epoch=initial_epoch,
+                                    validation_data=validation_data, callbacks=callbacks)
+
+    def extend_vocabulary(self, words, answers=()):
+        """
+        Appends new words to the vocabulary and grows the network accordingly.
+
+        The existing words keep their indexes, so the trained weights stay valid: the
+        embedding tables get new rows and the output `Dense` layer (if untied) new columns, and only
+        these are freshly initialized, every other weight being copied from the current network.
+
+        Args:
+            words (iterable of str): Words to add; those already known are ignored.
+            answers (iterable of str, optional): Answers to add to the answer head, if any. Defaults to ().
+
+        Returns:
+            list of str: The words actually added.
+        """
+        new_words = [w for w in dict.fromkeys(words) if w not in self.word_indexes]
+        new_answers = [a for a in dict.fromkeys(answers) if a not in self.output_indexes] if self.answer_head else []
+        if not new_words and not new_answers:
+            return new_words
+
+        self.set_vocabulary(self.index_words + new_words,
+                            self.output_words + new_answers if self.answer_head else None)
+
+        old_weights = self.network.get_weights()
+        self.network = self.__build_network()
+        weights = self.network.get_weights()
+        for old, new in zip(old_weights, weights):
+            # the vocabulary axis grew: copy the old values in the leading part
+            new[tuple(slice(0, n) for n in old.shape)] = old
+        self.network.set_weights(weights)
+
+        return new_words
+
+    def fine_tune(self, url, epochs=5, batch_size=32):
+        """
+        Warm-starts the trained network on new stories instead of retraining from scratch.
+
+        The words of the new file that are not in the vocabulary are added (see
+        `extend_vocabulary`), then the network is trained on the new samples only.
+
+        Args:
+            url (str): Path to a bAbI file with the new stories.
+            epochs (int, optional): Number of fine-tuning epochs. Defaults to 5.
+            batch_size (int, optional): Batch size. Defaults to 32.
+
+        Returns:
+            keras.callbacks.History: The training history returned by `fit`.
+        """
+        stats = DatasetStatistics()
+        data = CompactDataset.from_file(url, stats=stats)
+
+        self.extend_vocabulary(stats.vocabulary(), stats.answers)
+        data.reindex(self.word_indexes)
+
+        inputs, queries, answers = self.vectorize(data)
+        self.network.compile(optimizer='rmsprop', loss='categorical_crossentropy', metrics=['accuracy'])
+        return self.network.fit([inputs, queries], answers, batch_size=batch_size, epochs=epochs)
+
+    def get_inference_network(self):
+        """
+        Returns a multi-output view of the network giving the answer distribution and the attention.
+
+        The view shares the layers (and weights) of `network`, so a single forward pass gives
+        both outputs. It is rebuilt only when `network` is replaced (e.g. by `Model.load`).
+        The attention layer is found by name, or as the first softmax of the graph for
+        networks saved before it was named.
 
-    def predict(self, story, question):
+        Returns:
+            keras.Model: A model with outputs [answer probabilities, attention weights].
+        """
+        if self.__inference_source is not self.network:
+            try:
+                attention = self.network.get_layer('attention')
+            except ValueError:
+                attention = next(layer for layer in self.network.layers
+                                 if isinstance(layer, Activation) and layer.get_config()['activation'] == 'softmax')
+
+            self.__inference_network = Model(self.network.inputs, [self.network.outputs[0], attention.output])
+            self.__inference_source = self.network
+
+        return self.__inference_network
+
+    def get_story_networks(self):
+        """
+        Splits the network into the part depending on the story only and the rest.
+
+        The story encoder computes the memories of the story (the outputs of the layers
+        named "encoded_m" and "encoded_c", or "memory_m" and "memory_c" for the sentence
+        architecture), and the answering network goes from these memories and the question
+        to the answer distribution; the sentence attention also reads the story itself to
+        mask the empty slots. Both share the layers of `network` and are rebuilt only when
+        it is replaced. Networks saved before these layers were named, or whose split does not
+        give the answers of the whole network, are not split: the "encoding" is the story
+        input and the answering network is the whole network.
+
+        Returns:
+            tuple of keras.Model: The story encoder and the answering network.
+        """
+        if self.__story_source is not self.network:
+            story, question = self.network.inputs
+            names = ('memory_m', 'memory_c') if self.architecture == 'sentence' else ('encoded_m', 'encoded_c')
+            try:
+                encodings = [self.network.get_layer(name).output for name in names]
+            except ValueError:
+                encodings = []
+            if not encodings or any(isinstance(layer, SlotAttention) for layer in self.network.layers):
+                encodings.append(story)
+            networks = (Model(story, encodings), Model(encodings + [question], self.network.outputs[0]))
+
+            # the split must answer like `predict`: checked once on random samples, else the network is not split
+            rng = np.random.default_rng(0)
+            stories, queries = (rng.integers(0, self.vocab_size, (4,) + tuple(t.shape[1:])) for t in (story, question))
+            encoded = networks[0](stories, training=False)
+            encoded = list(encoded) if isinstance(encoded, (list, tuple)) else [encoded]
+            split = networks[1]([np.asarray(e) for e in encoded] + [queries], training=False)
+            if not np.allclose(split, self.network([stories, queries], training=False), atol=1e-5):
+                networks = (Model(story, [story]), Model([story, question], self.network.outputs[0]))
+
+            self.__story_networks = networks
+            self.__story_source = self.network
+
+        return self.__story_networks
+
+    def encode_story(self, story):
+        """
+        Tokenizes, vectorizes and encodes a story ahead of the question (see `get_story_networks`).
+
+        Args:
+            story (str): The context or story text.
+
+        Returns:
+            list of np.ndarray: The story encodings, to give to `predict_encoded`.
+        """
+        entries = transform_entry(story, '', flatten=self.architecture == 'flat')
+        inputs, _ = self.vectorize(entries, entry=True)
+
+        encoder, _ = self.get_story_networks()
+        encodings = encoder(inputs, training=False)
+        if not isinstance(encodings, (list, tuple)):
+            encodings = [encodings]
+        return [np.asarray(encoding) for encoding in encodings]
+
+    def predict_encoded(self, encodings, question):
+        """
+        Predicts the answer of a question about a story already encoded by `encode_story`.
+
+        Only the question is tokenized and vectorized, and only the question-dependent
+        part of the network runs.
+
+        Args:
+            encodings (list of np.ndarray): The story encodings returned by `encode_story`.
+            question (str): The question related to the story.
+
+        Returns:
+            tuple[str, float]: The refined answer and its confidence score (0-100).
+        """
+        entries = transform_entry('', question, flatten=self.architecture == 'flat')
+        _, queries = self.vectorize(entries, entry=True)
+
+        _, answering = self.get_story_networks()
+        raw_pred = np.asarray(answering(list(encodings) + [queries], training=False))[0]
+        val_max = int(np.argmax(raw_pred))
+        return affine_answer(question, self.output_words[val_max]), float(raw_pred[val_max] * 100)
+
+    def predict_batch(self, stories, questions, return_attention=False, batch_size=32):
+        """
+        Predict the answers of several story-question pairs with batched inference.
+
+        Args:
+            stories (list of str): The context or story texts.
+            questions (list of str): The questions, one per story.
+            return_attention (bool, optional): Also return the attention weights of each pair.
+                                               Defaults to False.
+            batch_size (int, optional): Number of pairs per inference batch. Defaults to 32.
+
+        Returns:
+            list of tuple: For each pair, the refined answer and its confidence score (0-100),
+                           followed by the attention weights if `return_attention` is True.
+                           The attention is trimmed to the actual story: a (story tokens,
+                           question tokens) matrix for the flat architecture, one weight per
+                           kept sentence for the sentence architecture.
+        """
+        flatten = self.architecture == 'flat'
+        entries = [transform_entry(story, question, flatten=flatten)[0] for story, question in zip(stories, questions)]
+        inputs, queries = self.vectorize(entries, entry=True)
+
+        # answer distribution and attention come from the same forward pass
+        raw_preds, attentions = self.get_inference_network().predict([inputs, queries], batch_size=batch_size,
+                                                                     verbose=0)
+        return format_predictions(entries, questions, raw_preds, self.output_words,
+                                  attentions if return_attention else None, flatten)
+
+    def predict(self, story, question, return_attention=False):
         """
         Predict the most likely word (code) and its confidence score from a story-question pair.
 
@@ -212,35 +808,24 @@ class Chatbot:
         Args:
             story (str): The context or story text.
             question (str): The question related to the story.
+            return_attention (bool, optional): Also return the attention weights computed during
+                                               the same forward pass (see `predict_batch`).
+                                               Defaults to False.
 
         Returns:
-            tuple[str, float]: The predicted word (answer) and its confidence score (0-100).
+            tuple[str, float]: The predicted word (answer) and its confidence score (0-100),
+                               followed by the attention weights if `return_attention` is True.
         """
-        entry = transform_entry(story, question)
-        inputs_test, queries_test = vectorization(
-            entry,
-            self.word_indexes,
-            self.story_maxlength,
-            self.query_maxlength,
-            entry=True
-        )
-
-        raw_pred = self.network.predict([inputs_test, queries_test])[0]  # shape: (vocab_size,)
-        val_max = int(np.argmax(raw_pred))
-        accuracy = float(raw_pred[val_max] * 100)
-
-        # Retrieve the word corresponding to val_max using while instead of for
-        items = list(self.word_indexes.items())
-        i = 0
-        prediction = ""
-        while i < len(items) and not prediction:
-            key, val = items[i]
-            if val == val_max:
-                prediction = key
-            i += 1
-
-        return affine_answer(question, prediction), accuracy
-
+        return self.predict_batch([story], [question], return_attention=return_attention, batch_size=1)[0]
 
+    def inference_session(self):
+        """
+        Takes a read-only snapshot of the chatbot that can be queried from several threads.
 
+        The TensorFlow thread counts are set per process, before the chatbot is built
+        (see `inference.configure_threads`).
 
+        Returns:
+            InferenceSession: The session (see `inference.py`).
+        """
+        return InferenceSession(self)
@@ -0,0 +1,331 @@
+from array import array
+import numpy as np
+from data_processing import iter_stories, format_story_text
+
+
+class StoryRecord:
+    """
+    Lightweight view on one sample of a `CompactDataset`.
+
+    The record only holds a reference to the dataset and its index: the token ids are
+    read from the dataset buffers on demand and turned back into words only when they
+    are displayed. It can be unpacked like the `(story, question, answer)` tuples of
+    `get_stories`.
+    """
+    __slots__ = ('dataset', 'index')
+
+    def __init__(self, dataset, index):
+        """
+        Args:
+            dataset (CompactDataset): The dataset holding the sample.
+            index (int): Index of the sample in the dataset.
+        """
+        self.dataset = dataset
+        self.index = index
+
+    @property
+    def story_ids(self):
+        """np.ndarray: Token ids of the whole story (a view on the token buffer)."""
+        return self.dataset.story_ids(self.index)
+
+    @property
+    def question_ids(self):
+        """np.ndarray: Token ids of the question (a view on the question buffer)."""
+        return self.dataset.question_ids(self.index)
+
+    @property
+    def answer_id(self):
+        """int: Token id of the answer."""
+        return int(self.dataset.answers[self.index])
+
+    @property
+    def story(self):
+        """list of str: Tokens of the whole story."""
+        return self.dataset.decode(self.story_ids)
+
+    @property
+    def sentences(self):
+        """list of list of str: Tokens of each sentence of the story."""
+        return [self.dataset.decode(ids) for ids in self.dataset.sentence_ids(self.index)]
+
+    @property
+    def question(self):
+        """list of str: Tokens of the question."""
+        return self.dataset.decode(self.question_ids)
+
+    @property
+    def answer(self):
+        """str: The answer."""
+        return self.dataset.words[self.answer_id]
+
+    def story_text(self):
+        """
+        Returns:
+            str: The story formatted for display (see `format_story_text`).
+        """
+        return format_story_text(self.story)
+
+    def question_text(self):
+        """
+        Returns:
+            str: The question formatted for display.
+        """
+        return ' '.join(self.question)
+
+    def __iter__(self):
+        return iter((self.story, self.question, self.answer))
+
+
+class CompactDataset:
+    """
+    Array-backed storage of story-question-answer samples.
+
+    Instead of lists of token strings, all the story sentences are stored once in a single
+    int32 buffer of token ids, delimited by an offset array (CSR layout). In the bAbI files
+    the samples of a story share its context, so each sample only stores the range of
+    sentences it sees; questions are stored the same way in their own buffer, and answers
+    in an id array. Slicing a dataset returns a view sharing these buffers.
+
+    Attributes:
+        words (list of str): Word of each token id (id 0 is the padding).
+        tokens (np.ndarray): int32 token ids of all the sentences, one after the other.
+        sentence_offsets (np.ndarray): Start of each sentence in `tokens` (plus the end of the last one).
+        story_bounds (np.ndarray): (samples, 2) range of sentences of the story of each sample.
+        question_tokens (np.ndarray): int32 token ids of all the questions.
+        question_bounds (np.ndarray): (samples, 2) range of each question in `question_tokens`.
+        answers (np.ndarray): int32 token id of the answer of each sample.
+    """
+    words = None
+    tokens = None
+    sentence_offsets = None
+    story_bounds = None
+    question_tokens = None
+    question_bounds = None
+    answers = None
+
+    def __init__(self, words, tokens, sentence_offsets, story_bounds, question_tokens, question_bounds, answers):
+        self.words = words
+        self.tokens = tokens
+        self.sentence_offsets = sentence_offsets
+        self.story_bounds = story_bounds
+        self.question_tokens = question_tokens
+        self.question_bounds = question_bounds
+        self.answers = answers
+
+    @classmethod
+    def from_samples(cls, samples):
+        """
+        Builds a dataset from parsed samples whose stories are lists of tokenized sentences.
+
+        Consecutive samples whose story extends the previous one (the questions of a same
+        bAbI story) share its sentences, which are therefore only stored once.
+
+        Args:
+            samples (iterable): Tuples (sentences, question, answer), e.g. from `iter_stories`.
+
+        Returns:
+            CompactDataset: The dataset, with ids in order of first appearance of the words.
+        """
+        word_ids = {'': 0}
+        tokens, sentence_offsets = array('i'), array('q', [0])
+        story_bounds, question_tokens, question_bounds, answers = array('q'), array('i'), array('q'), array('i')
+
+        def encode(sentence):
+            return [word_ids.setdefault(w, len(word_ids)) for w in sentence]
+
+        current_story = []
+        story_start = 0
+        for story, question, answer in samples:
+            known = len(current_story)
+            if not (known <= len(story) and story[:known] == current_story):
+                # a new story begins
+                current_story = []
+                known = 0
+                story_start = len(sentence_offsets) - 1
+
+            for sentence in story[known:]:
+                tokens.extend(encode(sentence))
+                sentence_offsets.append(len(tokens))
+                current_story.append(sentence)
+
+            story_bounds.extend((story_start, story_start + len(story)))
+            question_bounds.append(len(question_tokens))
+            question_tokens.extend(encode(question))
+            question_bounds.append(len(question_tokens))
+            answers.append(word_ids.setdefault(answer, len(word_ids)))
+
+        return cls(list(word_ids),
+                   np.frombuffer(tokens, dtype=np.int32),
+                   np.frombuffer(sentence_offsets, dtype=np.int64),
+                   np.frombuffer(story_bounds, dtype=np.int64).reshape(-1, 2),
+                   np.frombuffer(question_tokens, dtype=np.int32),
+                   np.frombuffer(question_bounds, dtype=np.int64).reshape(-1, 2),
+                   np.frombuffer(answers, dtype=np.int32))
+
+    @classmethod
+    def from_file(cls, url, stats=None):
+        """
+        Streams a bAbI file into a compact dataset.
+
+        Args:
+            url (str): Path to the bAbI dataset text file.
+            stats (DatasetStatistics, optional): Collector filled while parsing. Defaults to None.
+
+        Returns:
+            CompactDataset: The dataset.
+        """
+        with open(url, 'r', encoding='utf-8') as f:
+            return cls.from_samples(iter_stories(f, stats))
+
+    def reindex(self, word_indexes):
+        """
+        Translates the token ids to the indexes of a vocabulary shared with other datasets.
+
+        Args:
+            word_indexes (dict): Dictionary mapping words to their indices (0 is the padding).
+
+        Raises:
+            KeyError: If a word of the dataset is missing from `word_indexes`.
+        """
+        mapping = np.array([0] + [word_indexes[w] for w in self.words[1:]], dtype=np.int32)
+        self.tokens = mapping[self.tokens]
+        self.question_tokens = mapping[self.question_tokens]
+        self.answers = mapping[self.answers]
+
+        self.words = [''] * (len(word_indexes) + 1)
+        for word, index in word_indexes.items():
+            self.words[index] = word
+
+    def __len__(self):
+        return len(self.answers)
+
+    def __getitem__(self, key):
+        """
+        Returns a record view for an index, or a dataset view sharing the buffers for a slice.
+
+        Args:
+            key (int or slice): Index of a sample or range of samples.
+
+        Returns:
+            StoryRecord or CompactDataset: The record or the dataset view.
+        """
+        if isinstance(key, slice):
+            return CompactDataset(self.words, self.tokens, self.sentence_offsets, self.story_bounds[key],
+                                  self.question_tokens, self.question_bounds[key], self.answers[key])
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("sample index out of range")
+        return StoryRecord(self, key)
+
+    def __iter__(self):
+        return (StoryRecord(self, i) for i in range(len(self)))
+
+    def decode(self, ids):
+        """
+        Args:
+            ids (iterable of int): Token ids.
+
+        Returns:
+            list of str: The corresponding words.
+        """
+        return [self.words[i] for i in ids]
+
+    def story_ids(self, index):
+        """Returns the token ids of the story of a sample, as a view on the token buffer."""
+        first, last = self.story_bounds[index]
+        return self.tokens[self.sentence_offsets[first]:self.sentence_offsets[last]]
+
+    def sentence_ids(self, index):
+        """Returns the token ids of each sentence of the story of a sample, as views on the token buffer."""
+        first, last = self.story_bounds[index]
+        offsets = self.sentence_offsets
+        return [self.tokens[offsets[i]:offsets[i + 1]] for i in range(first, last)]
+
+    def question_ids(self, index):
+        """Returns the token ids of the question of a sample, as a view on the question buffer."""
+        start, end = self.question_bounds[index]
+        return self.question_tokens[start:end]
+
+    def one_hot_answers(self, answer_indexes=None):
+        """
+        Args:
+            answer_indexes (dict, optional): Mapping from an answer to its output index, for
+                                             an output layer restricted to the answers.
+                                             Defaults to None (outputs over the vocabulary).
+
+        Returns:
+            np.ndarray: One-hot answer vectors over the vocabulary (index 0 reserved) or the answers.
+
+        Raises:
+            KeyError: If an answer is missing from `answer_indexes`.
+        """
+        if answer_indexes is None:
+            labels, columns = self.answers, len(self.words)
+        else:
+            mapping = np.array([answer_indexes.get(w, -1) for w in self.words])
+            labels, columns = mapping[self.answers], len(answer_indexes)
+            if (labels < 0).any():
+                raise KeyError(self.words[self.answers[np.argmin(labels)]])
+
+        targets = np.zeros((len(self), columns))
+        targets[np.arange(len(self)), labels] = 1
+        return targets
+
+    def vectorize(self, story_maxlen, query_maxlen, entry=False, answer_indexes=None):
+        """
+        Builds the padded arrays of the flat architecture, like `vectorization`.
+
+        Sequences are padded and truncated at the beginning (as `pad_sequences` does).
+
+        Args:
+            story_maxlen (int): Length of the story vectors.
+            query_maxlen (int): Length of the question vectors.
+            entry (bool, optional): If True, the answers are not returned. Defaults to False.
+            answer_indexes (dict, optional): Output index of each answer (see `one_hot_answers`).
+
+        Returns:
+            tuple: (stories, queries) or (stories, queries, one_hot_answers).
+        """
+        stories = np.zeros((len(self), story_maxlen), dtype=np.int32)
+        queries = np.zeros((len(self), query_maxlen), dtype=np.int32)
+        for i in range(len(self)):
+            ids = self.story_ids(i)[-story_maxlen:]
+            stories[i, story_maxlen - len(ids):] = ids
+            ids = self.question_ids(i)[-query_maxlen:]
+            queries[i, query_maxlen - len(ids):] = ids
+
+        if entry:
+            return stories, queries
+        return stories, queries, self.one_hot_answers(answer_indexes)
+
+    def vectorize_sentences(self, memory_size, sentence_maxlen, query_maxlen, entry=False, answer_indexes=None):
+        """
+        Builds the memory slots of the sentence architecture, like `vectorization_sentences`.
+
+        Slots and questions are padded and truncated at the end, for the position encoding.
+
+        Args:
+            memory_size (int): Number of memory slots (the last sentences are kept).
+            sentence_maxlen (int): Maximum number of words per sentence.
+            query_maxlen (int): Length of the question vectors.
+            entry (bool, optional): If True, the answers are not returned. Defaults to False.
+            answer_indexes (dict, optional): Output index of each answer (see `one_hot_answers`).
+
+        Returns:
+            tuple: (story_slots, queries) or (story_slots, queries, one_hot_answers).
+        """
+        slots = np.zeros((len(self), memory_size, sentence_maxlen), dtype=np.int32)
+        queries = np.zeros((len(self), query_maxlen), dtype=np.int32)
+        for i in range(len(self)):
+            sentences = self.sentence_ids(i)[-memory_size:]
+            first_slot = memory_size - len(sentences)
+            for j, ids in enumerate(sentences):
+                ids = ids[:sentence_maxlen]
+                slots[i, first_slot + j, :len(ids)] = ids
+            ids = self.question_ids(i)[:query_maxlen]
+            queries[i, :len(ids)] = ids
+
+        if entry:
+            return slots, queries
+        return slots, queries, self.one_hot_answers(answer_indexes)
@@ -1,6 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
-from data_processing import format_story_text
 from Model import Model
 from View import View
 
@@ -15,11 +15,18 @@ class Controller:
         - Initialize the View with necessary data from the Model.
         - Handle user interactions by linking view events to controller methods.
         - Manage prediction results and coordinate updates between the model and the view.
+        - Encode the story in the background while it is edited, so that answering a
+          question only runs the question-dependent part of the network.
     """
+    # Delay without edits before the story is encoded, in milliseconds
+    ENCODING_DELAY = 300
 
     model = None
     vue = None
     pred_results = None
+    executor = None
+    __pending = None
+    __encoding = None
 
     def __init__(self, path_dataset, path_model):
         """
@@ -28,15 +35,48 @@ class Controller:
 
         Args:
             path_dataset (str): Path to the dataset used to initialize/train the model.
-            path_model (str): Path to the pre-trained model or model storage location.
+            path_model (str): Directory of the model registry holding the pre-trained models.
         """
         self.model = Model(path_dataset, path_model)
         self.vue = View(self.model.chatbot.word_indexes)
 
+        # a single worker: encodings run one after the other, the latest story last
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
         self.vue.set_story_button_command(self.load_from_test)
         self.vue.set_answer_button_command(self.get_answer)
+        self.vue.set_story_change_command(self.schedule_encoding)
         self.vue.master.mainloop()
 
+        self.executor.shutdown(wait=False)
+
+    def schedule_encoding(self):
+        """
+        Debounce the story edits: the story is encoded once it has not changed for `ENCODING_DELAY` ms.
+        """
+        if self.__pending is not None:
+            self.vue.master.after_cancel(self.__pending)
+        self.__pending = self.vue.master.after(self.ENCODING_DELAY, self.encode_story)
+
+    def encode_story(self):
+        """
+        Start encoding the current story on the background thread, unless it is already encoded.
+
+        Returns:
+            concurrent.futures.Future: The pending encoding (see `Chatbot.encode_story`), or None without story.
+        """
+        if self.__pending is not None:
+            self.vue.master.after_cancel(self.__pending)
+            self.__pending = None
+
+        story = self.vue.get_story()
+        if not story:
+            return None
+
+        if self.__encoding is None or self.__encoding[0] != story:
+            self.__encoding = (story, self.executor.submit(self.model.chatbot.encode_story, story))
+        return self.__encoding[1]
+
     def load_from_test(self):
         """
         Load a random story and question from the test dataset,
@@ -44,19 +84,21 @@ class Controller:
         """
         self.vue.random_index = np.random.randint(0, len(self.model.chatbot.test))
 
-        # Extract raw story and question
-        story_list = self.model.chatbot.test[self.vue.random_index][0]
-        question_list = self.model.chatbot.test[self.vue.random_index][1]
+        # The record is decoded from the compact dataset only now, for display
+        record = self.model.chatbot.test[self.vue.random_index]
 
         # Format story text outside the view
-        clean_story = format_story_text(story_list)
-        clean_question = ' '.join(question_list)
+        clean_story = record.story_text()
+        clean_question = record.question_text()
 
         # Update the view
         self.vue.display_story(clean_story)
         self.vue.display_question(clean_question)
         self.vue.clear_answer()
 
+        # no typing to wait for: the new story is encoded right away
+        self.encode_story()
+
     def get_answer(self):
         """
         Retrieve the model's predicted answer for the current story and question,
@@ -64,15 +106,16 @@ class Controller:
 
         Process:
             - Fetch the current story and question from the view.
-            - Use the model's `predict` method to get the predicted word and confidence.
+            - Wait for the encoding of the story, started in the background when it was
+              edited or loaded (or start it now if the story changed since).
+            - Use the model's `predict_encoded` method to get the predicted word and confidence.
             - Format the result as: "<word> : certainty = <score>%"
             - Update the view's answer display with this formatted string.
         """
         formatted = ""
         if len(self.vue.get_story()) > 0 and len(self.vue.get_question()) > 0:
-            prediction, score = self.model.chatbot.predict(
-                self.vue.get_story(), self.vue.get_question()
-            )
+            encodings = self.encode_story().result()
+            prediction, score = self.model.chatbot.predict_encoded(encodings, self.vue.get_question())
 
             formatted = f"{prediction} : certainty = {score:.2f}%"
 
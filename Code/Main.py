@@ -1,6 +1,6 @@
 from Controller import *
 
 if __name__ == '__main__':
-	controller = Controller(path_dataset="../Data/{}.txt", path_model="../Network/model")
+	controller = Controller(path_dataset="../Data/{}.txt", path_model="../Network")
 
 
@@ -1,7 +1,11 @@
-import os
+import json
+import time
 from tensorflow.keras.models import model_from_json
 from Chatbot import Chatbot
-from helpers import get_new_modelname
+from ModelRegistry import ModelRegistry
+from helpers import get_vocabulary_hash
+from distribution import is_chief
+from checkpointing import clear_checkpoints, run_directory
 
 
 class Model:
@@ -9,84 +13,204 @@ class Model:
     Wrapper class that manages a Chatbot instance, including loading a pre-trained model
     if available or training a new one otherwise.
 
+    The networks are stored in a `ModelRegistry`, whose index gives the latest (or a tagged)
+    model directly and records the metadata of every saved network.
+
     Attributes:
         chatbot (Chatbot): Instance of the Chatbot class used for training and inference.
+        registry (ModelRegistry): Registry where the networks are loaded from and saved to.
+        entry (dict): Registry entry of the network currently loaded (or last saved).
     """
+    CHECKPOINT_DIR = 'checkpoints'
+    VOCABULARY_EXTENSION = '.vocab.json'
+
     chatbot = None
+    registry = None
+    entry = None
 
-    def __init__(self, path_textfiles, file_name):
+    def __init__(self, path_textfiles, model_dir, strategy=None, architecture='flat', tag=None, answer_head=False,
+                 weight_tying=None, retrain=False):
         """
         Initializes the Model by creating a Chatbot instance using the given dataset path.
-        Checks if a saved model file exists with the given file_name; if yes, loads the model,
-        otherwise trains the chatbot model and saves it.
+        Looks up the registry for the model tagged `tag` (or the latest one); if found, loads it,
+        otherwise trains the chatbot model and saves it. The training is checkpointed in the
+        "checkpoints" directory of the registry, so a partially trained run is resumed.
 
         Args:
            path_textfiles (str): Path pattern to the training and test text files.
-           file_name (str): Base file name to load/save the model files (without extension).
+           model_dir (str): Directory of the model registry.
+           strategy (tf.distribute.Strategy, optional): Strategy used if the model has to be trained.
+                                                        Only the chief worker saves the result.
+           architecture (str, optional): Architecture of the chatbot network ("flat" or "sentence")
+                                         when a new model is trained; a saved model keeps the one
+                                         recorded in the registry. Defaults to "flat".
+           tag (str, optional): Tag or name of the model to load, also given to a newly trained model.
+                                Defaults to None (latest model).
+           answer_head (bool, optional): Whether a newly trained network only scores the answers
+                                         (see `Chatbot`); a saved model keeps its own. Defaults to False.
+           weight_tying (str, optional): Weight tying of a newly trained network ("adjacent" or
+                                         "layerwise", see `Chatbot`); a saved model keeps its own.
+                                         Defaults to None.
+           retrain (bool, optional): Train a new model even if one is registered (it is saved as a new
+                                     entry, with the tag if any). Defaults to False.
         """
-        self.chatbot = Chatbot(path_textfiles)
+        self.registry = ModelRegistry(model_dir)
+        if retrain:
+            entry = None
+        else:
+            entry = self.registry.get(tag) if tag else self.registry.latest()
 
-        if os.path.isfile(file_name + '.json'):
-            self.load(file_name)
+        if entry is not None:
+            self.chatbot = Chatbot(path_textfiles, architecture=entry.get('architecture', architecture),
+                                   answer_head=entry.get('answer_head', False), **entry.get('hyperparameters', {}))
+            self.load(entry)
         else:
-            self.chatbot.train_model()
-            self.save()
+            self.chatbot = Chatbot(path_textfiles, architecture=architecture, answer_head=answer_head,
+                                   weight_tying=weight_tying)
+
+            # an interrupted training run resumes from its last checkpoint
+            checkpoint_dir = self.registry.path(self.CHECKPOINT_DIR)
+
+            start = time.time()
+            history = self.chatbot.train_model(strategy=strategy, checkpoint_dir=checkpoint_dir)
+            training_time = time.time() - start
+
+            if is_chief(strategy):
+                val_accuracy = history.history.get('val_accuracy')
+                self.save(tags=(tag,) if tag else (),
+                          accuracy=float(val_accuracy[-1]) if val_accuracy else None,
+                          training_time=training_time)
+                # the run is complete, its checkpoints are no longer needed
+                clear_checkpoints(run_directory(checkpoint_dir, self.chatbot.get_run_id()))
+
+    @classmethod
+    def from_chatbot(cls, chatbot, model_dir):
+        """
+        Wraps an already built chatbot (e.g. a distilled student) without loading or training anything.
+
+        Args:
+            chatbot (Chatbot): The chatbot whose network will be saved.
+            model_dir (str): Directory of the model registry.
+
+        Returns:
+            Model: The model, ready to be saved.
+        """
+        model = cls.__new__(cls)
+        model.chatbot = chatbot
+        model.registry = ModelRegistry(model_dir)
+        return model
 
-    def save(self, file_path="../Network", model_extension=".json", weights_extension=".weights.h5"):
+    def save(self, tags=(), latest=True, model_extension=".json", weights_extension=".weights.h5", **metadata):
         """
-        Save the current chatbot model architecture and weights to disk.
+        Save the current chatbot model architecture and weights to disk and register them.
 
         Args:
-            file_path (str, optional): Directory path where the model and weights files will be saved.
-                                       Defaults to "../Network".
+            tags (iterable of str, optional): Tags given to the saved model (e.g. "best"). Defaults to ().
+            latest (bool, optional): Whether the saved model becomes the latest one of the registry,
+                                     i.e. the one loaded by default. Defaults to True.
             model_extension (str, optional): File extension for the model architecture file.
                                              Defaults to ".json".
             weights_extension (str, optional): File extension for the model weights file.
                                                Defaults to ".weights.h5".
+            **metadata: Additional information stored in the registry (accuracy, training_time, ...).
 
         Process:
-            - Creates the directory if it does not exist.
-            - Generates a new model name to avoid overwriting existing files.
+            - Reserves a new model name in the registry so that no existing file is overwritten.
+            - Saves the vocabulary (word of each index) and the answers of the output layer to a JSON file.
             - Serializes the model architecture to a file with the specified model extension.
             - Saves the model weights to a file with the specified weights extension.
-        """
+            - Registers the files with the vocabulary hash, the architecture, the hyperparameters
+              of the chatbot and the metadata.
 
-        if not os.path.isdir(file_path):
-            os.makedirs(file_path)
+        Returns:
+            dict: The registry entry of the saved model.
+        """
+        model_name = self.registry.reserve()
+        files = {'model': model_name + model_extension, 'weights': model_name + weights_extension,
+                 'vocabulary': model_name + self.VOCABULARY_EXTENSION}
 
-        model_name = get_new_modelname(file_path)
+        # Save the vocabulary, which may have been extended by a fine-tuning, and the answers of the answer head
+        with open(self.registry.path(files['vocabulary']), "w", encoding='utf-8') as vocabulary_file:
+            json.dump({'words': self.chatbot.index_words,
+                       'answers': self.chatbot.output_words if self.chatbot.answer_head else None}, vocabulary_file)
 
         # Serialize the model architecture to JSON format
         model_json = self.chatbot.network.to_json()
-        with open(os.path.join(file_path, model_name + model_extension), "w") as json_file:
+        with open(self.registry.path(files['model']), "w") as json_file:
             json_file.write(model_json)
 
         # Save the model weights to an HDF5 file
-        self.chatbot.network.save_weights(os.path.join(file_path, model_name + weights_extension))
+        self.chatbot.network.save_weights(self.registry.path(files['weights']))
 
-    def load(self, file_path, model_extension=".json", weights_extension=".weights.h5"):
+        self.entry = self.registry.register(model_name, files, tags=tags, latest=latest,
+                                            architecture=self.chatbot.architecture,
+                                            answer_head=self.chatbot.answer_head,
+                                            hyperparameters=self.chatbot.get_hyperparameters(),
+                                            vocabulary_hash=get_vocabulary_hash(self.chatbot.word_indexes),
+                                            **metadata)
+        return self.entry
+
+    def load(self, entry):
         """
-        Load a saved model architecture and its weights from disk into the chatbot's network.
+        Load a registered model architecture and its weights from disk into the chatbot's network.
 
         Args:
-            file_path (str): Base file path (without extension) where the model and weights files are stored.
-            model_extension (str, optional): Extension of the model architecture file (default is ".json").
-            weights_extension (str, optional): Extension of the model weights file (default is ".weights.h5").
+            entry (dict): Registry entry of the model (see `ModelRegistry.latest` / `ModelRegistry.get`).
 
         Process:
+            - Restores the vocabulary saved with the model, if any (fine-tuned models extend it).
+            - Checks that the model was trained on the same vocabulary as the chatbot.
             - Reads the model architecture from the JSON file.
-            - Loads the model architecture into the chatbot's network.
+            - Loads the model architecture into the chatbot's network, with its padding lengths.
             - Loads the corresponding weights into the model.
 
         Raises:
             IOError: If the model or weights files cannot be found or opened.
-            ValueError: If the loaded model JSON is invalid.
+            ValueError: If the vocabulary does not match or the loaded model JSON is invalid.
         """
-        json_file = open(file_path + model_extension, 'r')
+        if 'vocabulary' in entry['files']:
+            with open(self.registry.path(entry['files']['vocabulary']), 'r', encoding='utf-8') as vocabulary_file:
+                vocabulary = json.load(vocabulary_file)
+            # older vocabulary files only hold the list of words
+            if isinstance(vocabulary, list):
+                vocabulary = {'words': vocabulary, 'answers': None}
+            self.chatbot.set_vocabulary(vocabulary['words'], vocabulary['answers'])
+
+        vocabulary_hash = entry.get('vocabulary_hash')
+        if vocabulary_hash and vocabulary_hash != get_vocabulary_hash(self.chatbot.word_indexes):
+            raise ValueError(f"Model {entry['name']} was trained on a different vocabulary")
+
+        json_file = open(self.registry.path(entry['files']['model']), 'r')
         model_json = json_file.read()
         json_file.close()
 
-        self.chatbot.network = model_from_json(model_json)
+        # the padding lengths are those of the saved network
+        self.chatbot.set_network(model_from_json(model_json))
 
         # load weights into new model
-        self.chatbot.network.load_weights(file_path + weights_extension)
+        self.chatbot.network.load_weights(self.registry.path(entry['files']['weights']))
+        self.entry = entry
+
+    def fine_tune(self, url, epochs=5, tags=()):
+        """
+        Adapts the loaded network to new stories and registers the result as a new model.
+
+        New words are added to the vocabulary and the network is trained on the new
+        samples only for a few epochs (see `Chatbot.fine_tune`), which takes seconds
+        instead of a full training run.
+
+        Args:
+            url (str): Path to a bAbI file with the new stories.
+            epochs (int, optional): Number of fine-tuning epochs. Defaults to 5.
+            tags (iterable of str, optional): Tags given to the fine-tuned model. Defaults to ().
+
+        Returns:
+            dict: The registry entry of the fine-tuned model.
+        """
+        start = time.time()
+        history = self.chatbot.fine_tune(url, epochs=epochs)
+        training_time = time.time() - start
+
+        return self.save(tags=tags, train_accuracy=float(history.history['accuracy'][-1]),
+                         training_time=training_time, fine_tuned_from=self.entry['name'] if self.entry else None,
+                         fine_tuned_on=url)
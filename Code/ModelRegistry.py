@@ -0,0 +1,276 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class ModelRegistry:
+    """
+    Versioned registry of the trained networks stored in a directory.
+
+    The registry keeps a small JSON index next to the model files, so that finding the
+    latest model or a tagged one never requires listing the directory. Each entry holds
+    the file names of the architecture and weights plus metadata (accuracy, vocabulary
+    hash, training time, size, ...). The index is always rewritten atomically (temporary
+    file then rename) while holding a lock (released if its owner dies), and model ids
+    are reserved from a counter, so concurrent trainers can neither overwrite each other's
+    files nor lose entries.
+
+    Index layout:
+        {"next_id": 3, "latest": "model2", "tags": {"best": "model1"},
+         "models": {"model1": {...}, "model2": {...}}}
+
+    Attributes:
+        directory (str): Directory holding the index and the model files.
+    """
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = 'index.lock'
+    STALE_LOCK_AGE = 60
+
+    directory = None
+
+    def __init__(self, directory):
+        """
+        Initializes the registry on the given directory, creating it if needed.
+
+        Args:
+            directory (str): Directory holding the index and the model files.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, file_name):
+        """
+        Returns the full path of a file of the registry.
+
+        Args:
+            file_name (str): Name of the file inside the registry directory.
+
+        Returns:
+            str: The path of the file.
+        """
+        return os.path.join(self.directory, file_name)
+
+    def latest(self):
+        """
+        Returns the entry of the most recently registered model.
+
+        Returns:
+            dict or None: The entry (with its "name"), or None if the registry is empty.
+        """
+        index = self.__read_index()
+        return self.__entry(index, index['latest'])
+
+    def get(self, key):
+        """
+        Returns the entry of a model given its tag or its name.
+
+        Args:
+            key (str): A tag (e.g. "best") or a model name (e.g. "model2").
+
+        Returns:
+            dict or None: The entry (with its "name"), or None if nothing matches.
+        """
+        index = self.__read_index()
+        return self.__entry(index, index['tags'].get(key, key))
+
+    def reserve(self, prefix="model"):
+        """
+        Reserves a new, unique model name.
+
+        The name is taken from the counter of the index, so two trainers running at the
+        same time always get different names even before their models are registered.
+
+        Args:
+            prefix (str, optional): Prefix of the model name. Defaults to "model".
+
+        Returns:
+            str: The reserved name (e.g. "model3").
+        """
+        with self.__lock():
+            index = self.__read_index()
+            name = f"{prefix}{index['next_id']}"
+            index['next_id'] += 1
+            self.__write_index(index)
+        return name
+
+    def register(self, name, files, tags=(), latest=True, **metadata):
+        """
+        Adds a model whose files have been written to the index and makes it the latest one.
+
+        Args:
+            name (str): Name returned by `reserve`.
+            files (dict): File names of the model, e.g. {"model": "model3.json", "weights": "model3.weights.h5"}.
+            tags (iterable of str, optional): Tags pointing to this model. Defaults to ().
+            latest (bool, optional): False to only reach the model through its name and tags, leaving
+                                     the latest model unchanged. Defaults to True.
+            **metadata: Any JSON-serializable information about the model (accuracy, ...).
+
+        Returns:
+            dict: The registered entry.
+        """
+        entry = dict(metadata)
+        entry['files'] = dict(files)
+        entry['size'] = sum(os.path.getsize(self.path(f)) for f in files.values())
+        entry['created'] = time.time()
+
+        with self.__lock():
+            index = self.__read_index()
+            index['models'][name] = entry
+            if latest:
+                index['latest'] = name
+            for tag in tags:
+                index['tags'][tag] = name
+            self.__write_index(index)
+
+        return dict(entry, name=name)
+
+    @staticmethod
+    def __entry(index, name):
+        """Returns the entry called `name` of the index with its name, or None."""
+        if name is None or name not in index['models']:
+            return None
+        return dict(index['models'][name], name=name)
+
+    def __read_index(self):
+        """Reads the index, returning an empty one if it does not exist yet."""
+        try:
+            with open(self.path(self.INDEX_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'next_id': 1, 'latest': None, 'tags': {}, 'models': {}}
+
+    def __write_index(self, index):
+        """Writes the index atomically: readers see either the old or the new version."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=self.INDEX_FILE, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path(self.INDEX_FILE))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def __lock(self, timeout=30, delay=0.05):
+        """
+        Holds the lock file of the registry for a read-modify-write of the index.
+
+        On POSIX systems the lock is an `flock` on the lock file, which the kernel releases
+        when its owner exits, even if it crashes. Elsewhere the lock file is created
+        exclusively and removed on release; a lock left by a dead process is broken once
+        it is older than `STALE_LOCK_AGE` seconds (see `__break_stale`). In both cases the
+        file records the host, the PID and the time of its owner.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the lock. Defaults to 30.
+            delay (float, optional): Seconds between two attempts. Defaults to 0.05.
+
+        Raises:
+            TimeoutError: If the lock could not be acquired in time.
+        """
+        lock_path = self.path(self.LOCK_FILE)
+        deadline = time.monotonic() + timeout
+        owner = json.dumps({'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time(),
+                            'token': uuid.uuid4().hex})
+
+        if fcntl is not None:
+            fd = os.open(lock_path, os.O_CREAT | os.O_RDWR)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"Could not lock the model registry {self.directory}")
+                        time.sleep(delay)
+                os.ftruncate(fd, 0)
+                os.write(fd, owner.encode('utf-8'))
+                yield
+            finally:
+                # closing the file releases the lock
+                os.close(fd)
+            return
+
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if self.__break_stale(lock_path):
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Could not lock the model registry {self.directory}")
+                time.sleep(delay)
+        try:
+            os.write(fd, owner.encode('utf-8'))
+            os.close(fd)
+            yield
+        finally:
+            # the lock is only removed if it is still ours (it may have been broken meanwhile)
+            if self.__read_lock(lock_path) == owner:
+                os.remove(lock_path)
+
+    @staticmethod
+    def __read_lock(path):
+        """Returns the owner record of a lock file, or None if it does not exist."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def __break_stale(self, lock_path):
+        """
+        Removes the lock file if it is older than `STALE_LOCK_AGE` seconds (an index update takes
+        milliseconds), which means that its owner died while holding it.
+
+        The file is first renamed to a name unique to this process, so that two waiters never
+        both break it, then its owner record is compared with the one found stale: if another
+        waiter already replaced the stale lock by its own, that lock is put back.
+
+        Args:
+            lock_path (str): Path of the lock file.
+
+        Returns:
+            bool: True if a stale lock was removed.
+        """
+        record = self.__read_lock(lock_path)
+        if record is None:  # released meanwhile
+            return False
+        try:
+            created = json.loads(record)['time']
+        except (ValueError, KeyError):  # not written yet, or the owner died while writing it
+            try:
+                created = os.path.getmtime(lock_path)
+            except FileNotFoundError:
+                return False
+        if time.time() - created <= self.STALE_LOCK_AGE:
+            return False
+
+        broken_path = f"{lock_path}.{uuid.uuid4().hex}"
+        try:
+            os.rename(lock_path, broken_path)
+        except FileNotFoundError:  # broken by another waiter
+            return False
+        if self.__read_lock(broken_path) != record:
+            # a live lock was taken instead: restore it, unless the lock was taken again since
+            try:
+                os.link(broken_path, lock_path)
+            except FileExistsError:
+                pass
+            os.remove(broken_path)
+            return False
+        os.remove(broken_path)
+        return True
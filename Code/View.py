@@ -183,6 +183,22 @@ class View:
         """
         self.story_button.config(command=command)
 
+    def set_story_change_command(self, command):
+        """
+        Set the callback function to be executed whenever the story text is modified
+        (by the user or by `display_story`).
+
+        Args:
+            command (callable): The function to be called after each modification.
+        """
+        def on_modified(event):
+            # the flag has to be reset for the next modification to fire the event again
+            if self.story_text.edit_modified():
+                self.story_text.edit_modified(False)
+                command()
+
+        self.story_text.bind('<<Modified>>', on_modified)
+
     def set_answer_button_command(self, command):
         """
         Set the callback function to be executed when the 'answer' button is clicked.
@@ -0,0 +1,232 @@
+import os
+import queue
+import threading
+import numpy as np
+from tensorflow.keras.callbacks import Callback
+
+CHECKPOINT_PREFIX = 'ckpt-'
+CHECKPOINT_EXTENSION = '.npz'
+
+
+class AsyncCheckpoint(Callback):
+    """
+    Keras callback saving periodic training checkpoints from a background thread.
+
+    At the end of every `every` epochs the weights, the optimizer state and the epoch
+    counter are copied to NumPy arrays (a cheap in-memory snapshot) and handed to a
+    writer thread, so the next training steps do not wait for the disk. Each checkpoint
+    is written to a temporary file then renamed, and only the last `keep` ones are kept.
+
+    Attributes:
+        directory (str): Directory of the checkpoint files.
+        run_id (str): Identifier of the training run, stored in every checkpoint.
+        every (int): Number of epochs between two checkpoints.
+        keep (int): Number of checkpoints kept on disk.
+    """
+    directory = None
+    run_id = None
+    every = None
+    keep = None
+
+    def __init__(self, directory, run_id, every=1, keep=3):
+        """
+        Initializes the callback and starts its writer thread.
+
+        Args:
+            directory (str): Directory of the checkpoint files, created if needed.
+            run_id (str): Identifier of the training run (see `latest_checkpoint`).
+            every (int, optional): Number of epochs between two checkpoints. Defaults to 1.
+            keep (int, optional): Number of checkpoints kept on disk. Defaults to 3.
+        """
+        super().__init__()
+        self.directory = directory
+        self.run_id = run_id
+        self.every = every
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+        # a small bound keeps at most a couple of snapshots in memory if the disk is slow
+        self.__queue = queue.Queue(maxsize=2)
+        self.__error = None
+        self.__writer = threading.Thread(target=self.__write_loop, daemon=True)
+        self.__writer.start()
+
+    def on_epoch_end(self, epoch, logs=None):
+        """
+        Snapshots the training state every `every` epochs and queues it for writing.
+
+        Args:
+            epoch (int): Index of the epoch that just ended (0-based).
+            logs (dict, optional): Metrics of the epoch.
+        """
+        if (epoch + 1) % self.every == 0:
+            self.__queue.put(snapshot(self.model, epoch + 1, self.run_id))
+
+    def on_train_end(self, logs=None):
+        """
+        Waits for the pending checkpoints to be written and stops the writer thread.
+
+        Raises:
+            Exception: The error raised by the writer thread, if any.
+        """
+        self.__queue.put(None)
+        self.__writer.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def __write_loop(self):
+        """Writes the queued snapshots until the end-of-training marker is received."""
+        while True:
+            state = self.__queue.get()
+            if state is None:
+                return
+            if self.__error is not None:
+                continue
+            try:
+                write_checkpoint(self.directory, state)
+                prune_checkpoints(self.directory, self.keep)
+            except Exception as error:
+                self.__error = error
+
+
+def snapshot(model, epoch, run_id):
+    """
+    Copies the training state of a compiled model into NumPy arrays.
+
+    Args:
+        model (keras.Model): The model being trained.
+        epoch (int): Number of completed epochs.
+        run_id (str): Identifier of the training run.
+
+    Returns:
+        dict: The arrays of the checkpoint ("w<i>" for weights, "o<i>" for optimizer variables).
+    """
+    state = {'epoch': np.array(epoch), 'run_id': np.array(run_id)}
+    for i, weights in enumerate(model.get_weights()):
+        state[f"w{i}"] = weights
+    for i, variable in enumerate(model.optimizer.variables):
+        state[f"o{i}"] = np.array(variable.numpy())
+    return state
+
+
+def write_checkpoint(directory, state):
+    """
+    Writes a snapshot atomically to `<directory>/ckpt-<epoch>.npz`.
+
+    Args:
+        directory (str): Directory of the checkpoint files.
+        state (dict): Snapshot returned by `snapshot`.
+
+    Returns:
+        str: The path of the written checkpoint.
+    """
+    path = os.path.join(directory, f"{CHECKPOINT_PREFIX}{int(state['epoch']):06d}{CHECKPOINT_EXTENSION}")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **state)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def list_checkpoints(directory):
+    """
+    Lists the complete checkpoint files of a directory, oldest first.
+
+    Args:
+        directory (str): Directory of the checkpoint files.
+
+    Returns:
+        list of str: Paths of the checkpoints.
+    """
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(CHECKPOINT_PREFIX) and name.endswith(CHECKPOINT_EXTENSION))
+    return [os.path.join(directory, name) for name in names]
+
+
+def prune_checkpoints(directory, keep):
+    """
+    Deletes all but the `keep` most recent checkpoints.
+
+    Args:
+        directory (str): Directory of the checkpoint files.
+        keep (int): Number of checkpoints to keep.
+    """
+    for path in list_checkpoints(directory)[:-keep]:
+        os.remove(path)
+
+
+def clear_checkpoints(directory):
+    """
+    Deletes every checkpoint of a directory, and the directory once empty, once the trained model has been saved.
+
+    Args:
+        directory (str): Directory of the checkpoint files.
+    """
+    for path in list_checkpoints(directory):
+        os.remove(path)
+    if os.path.isdir(directory) and not os.listdir(directory):
+        os.rmdir(directory)
+
+
+def run_directory(directory, run_id):
+    """
+    Returns the directory of the checkpoints of a training run.
+
+    Each run writes to its own subdirectory, so that runs sharing a checkpoint directory
+    (e.g. the one of a model registry) never overwrite or prune each other's checkpoints.
+
+    Args:
+        directory (str): Directory shared by the training runs.
+        run_id (str): Identifier of the training run.
+
+    Returns:
+        str: The path of the subdirectory.
+    """
+    return os.path.join(directory, run_id)
+
+
+def latest_checkpoint(directory, run_id):
+    """
+    Loads the most recent checkpoint written by the same training run.
+
+    Checkpoints of another run (e.g. another vocabulary or architecture) are ignored,
+    since their weights could not be restored into the current network.
+
+    Args:
+        directory (str): Directory of the checkpoint files.
+        run_id (str): Identifier of the training run.
+
+    Returns:
+        dict or None: The arrays of the checkpoint, or None if there is none to resume from.
+    """
+    for path in reversed(list_checkpoints(directory)):
+        with np.load(path) as data:
+            if str(data['run_id']) == run_id:
+                return {key: data[key] for key in data.files}
+    return None
+
+
+def restore_checkpoint(model, checkpoint):
+    """
+    Restores the weights and the optimizer state of a compiled model from a checkpoint.
+
+    Args:
+        model (keras.Model): The compiled model.
+        checkpoint (dict): Checkpoint returned by `latest_checkpoint`.
+
+    Returns:
+        int: The number of completed epochs, to be used as `initial_epoch`.
+    """
+    weights_nb = sum(1 for key in checkpoint if key.startswith('w'))
+    model.set_weights([checkpoint[f"w{i}"] for i in range(weights_nb)])
+
+    # the optimizer variables only exist once the optimizer has been built
+    model.optimizer.build(model.trainable_variables)
+    for i, variable in enumerate(model.optimizer.variables):
+        variable.assign(checkpoint[f"o{i}"])
+
+    return int(checkpoint['epoch'])
@@ -29,7 +29,7 @@ def tokenization(sentence):
     return [token for token in clean_tokens]
 
 
-def extract_stories(lines):
+def extract_stories(lines, stats=None):
     """
     Parses a list of text lines into a structured format of stories,
     questions, and answers, as found in the bAbI tasks dataset.
@@ -46,6 +46,8 @@ def extract_stories(lines):
     Args:
         lines (list of str): A list of strings, where each string represents
                              a single line from the bAbI tasks dataset.
+        stats (DatasetStatistics, optional): Collector fed with every new sentence
+                                             and every extracted sample. Defaults to None.
 
     Returns:
         list of tuple: A list of tuples, where each tuple represents an
@@ -68,7 +70,24 @@ def extract_stories(lines):
 
     """
     # list of (story, question, answer) tuplets that will be returned
-    data = []
+    return list(iter_stories(lines, stats))
+
+
+def iter_stories(lines, stats=None):
+    """
+    Lazily parses bAbI lines, yielding the samples of `extract_stories` one at a time.
+
+    Only the current story is kept in memory, so a file object of any size can be
+    streamed through it.
+
+    Args:
+        lines (iterable of str): Lines from the bAbI tasks dataset (e.g. an open file).
+        stats (DatasetStatistics, optional): Collector fed with every new sentence
+                                             and every extracted sample. Defaults to None.
+
+    Yields:
+        tuple: `(substory, question, answer)` as described in `extract_stories`.
+    """
     story = []
     for line in lines:
         line = line.strip()
@@ -89,7 +108,9 @@ def extract_stories(lines):
             q = tokenization(q)
             # construct the sub_story (current story up to this point)
             sub_story = [w for w in story if w]  # Filter out empty placeholders
-            data.append((sub_story, q, a))
+            if stats is not None:
+                stats.add_sample(sub_story, q, a)
+            yield sub_story, q, a
             story.append('')  # Add an empty placeholder to the story list for the fact line
 
         else:
@@ -97,10 +118,11 @@ def extract_stories(lines):
             sent = tokenization(line)
             # append it to the current story
             story.append(sent)
-    return data
+            if stats is not None:
+                stats.add_sentence(sent)
 
 
-def get_stories(url):
+def get_stories(url, flatten=True, stats=None):
     """
     Loads and processes bAbI task stories from a file, returning each story
     as formatted text along with its tokenized question and answer.
@@ -111,6 +133,9 @@ def get_stories(url):
 
     Args:
         url (str): Path to the bAbI dataset text file.
+        flatten (bool, optional): If False, the sentence boundaries are kept and each story
+                                  is a list of tokenized sentences. Defaults to True.
+        stats (DatasetStatistics, optional): Collector filled while parsing. Defaults to None.
 
     Returns:
         list of tuples: Each tuple contains:
@@ -131,7 +156,10 @@ def get_stories(url):
               'bathroom')]
     """
     with open(url, 'r', encoding='utf-8') as f:
-        raw_data = extract_stories(f.readlines())
+        raw_data = extract_stories(f, stats)
+
+    if not flatten:
+        return raw_data
 
     # flatten each story (list of sentence token lists) into one token list
     flat_story = lambda story_data: reduce(lambda acc, sent: acc + sent, story_data, [])
@@ -161,7 +189,7 @@ def format_story_text(story_list):
     return story_sequence
 
 
-def transform_entry(story_entry, question_entry):
+def transform_entry(story_entry, question_entry, flatten=True):
     """
     Transforms a single story entry and a question entry into a formatted list.
 
@@ -173,6 +201,8 @@ def transform_entry(story_entry, question_entry):
         story_entry (str): A string containing the story, with sentences separated
                            by newline characters. Each line will be tokenized.
         question_entry (str): A string containing the question to be tokenized.
+        flatten (bool, optional): If False, the story is kept as a list of tokenized
+                                  sentences (empty lines are dropped). Defaults to True.
 
     Returns:
         list of tuple: A list containing a single tuple. The tuple format is
@@ -185,13 +215,39 @@ def transform_entry(story_entry, question_entry):
     story = [tokenization(line.strip()) for line in story_entry.split('\n')]
     question = tokenization(question_entry)
 
+    if not flatten:
+        return [([sentence for sentence in story if sentence], question)]
+
     # merge all sentences of a single story in a signle list
     flat_story = lambda story: reduce(lambda x, y: x + y, story)
     data = [(flat_story(story), question)]
     return data
 
 
-def vectorization(data, word_indexes, story_maxlen, query_maxlen, entry=False):
+def one_hot_answer(answer, word_indexes, answer_indexes=None):
+    """
+    Encodes an answer as a one-hot vector over the outputs of the network.
+
+    Args:
+        answer (str): The answer.
+        word_indexes (dict): Dictionary mapping tokens (words) to their integer indices.
+        answer_indexes (dict, optional): Output index of each answer when the network only scores
+                                         the answers. Defaults to None (outputs over the vocabulary).
+
+    Returns:
+        np.ndarray: The one-hot vector.
+    """
+    if answer_indexes is None:
+        # index 0 is reserved
+        y = np.zeros(len(word_indexes) + 1)
+        y[word_indexes[answer]] = 1
+    else:
+        y = np.zeros(len(answer_indexes))
+        y[answer_indexes[answer]] = 1
+    return y
+
+
+def vectorization(data, word_indexes, story_maxlen, query_maxlen, entry=False, answer_indexes=None):
     """
     Converts textual stories, questions, and answers into numerical vectors suitable for model input.
 
@@ -209,6 +265,8 @@ def vectorization(data, word_indexes, story_maxlen, query_maxlen, entry=False):
         entry (bool, optional):
             - False (default): data includes answers, which are one-hot encoded.
             - True: data does not include answers (e.g., for prediction), so only story and query vectors are returned.
+        answer_indexes (dict, optional): Output index of each answer when the network only scores
+                                         the answers. Defaults to None (one-hot over the vocabulary).
 
     Returns:
         If entry=False:
@@ -235,10 +293,7 @@ def vectorization(data, word_indexes, story_maxlen, query_maxlen, entry=False):
             query_vectors.append(vect)
 
             # answer vector
-            # index 0 is reserved
-            y = np.zeros(len(word_indexes) + 1)
-            y[word_indexes[answer]] = 1
-            targets.append(y)
+            targets.append(one_hot_answer(answer, word_indexes, answer_indexes))
 
         # padding of the resulted vectors
         result = (pad_sequences(story_vectors, maxlen=story_maxlen),
@@ -258,3 +313,54 @@ def vectorization(data, word_indexes, story_maxlen, query_maxlen, entry=False):
         result = (pad_sequences(story_vectors, maxlen=story_maxlen),
                   pad_sequences(query_vectors, maxlen=query_maxlen))
     return result
+
+
+def vectorization_sentences(data, word_indexes, memory_size, sentence_maxlen, query_maxlen, entry=False,
+                            answer_indexes=None):
+    """
+    Converts stories kept as lists of sentences into memory slots suitable for the sentence-level model.
+
+    Each story becomes a matrix of `memory_size` rows (one per sentence) of `sentence_maxlen`
+    word indexes. Only the last `memory_size` sentences are kept, the oldest ones being evicted
+    (sliding window); shorter stories leave their first slots empty. Inside a slot, and in the
+    question, the words are padded (and truncated) at the end so that the position encoding
+    sees each word at its real position.
+
+    Args:
+        data (list): Same as `vectorization`, except that each story is a list of tokenized sentences.
+        word_indexes (dict): Dictionary mapping tokens (words) to their integer indices.
+        memory_size (int): Number of memory slots (sentences) per story.
+        sentence_maxlen (int): Maximum number of words per sentence (longer ones are truncated).
+        query_maxlen (int): Maximum length for question sequences (used for padding).
+        entry (bool, optional): True if `data` carries no answers. Defaults to False.
+        answer_indexes (dict, optional): Output index of each answer (see `vectorization`). Defaults to None.
+
+    Returns:
+        If entry=False:
+            tuple of (story_slots, padded_query_vectors, one_hot_answer_vectors)
+        If entry=True:
+            tuple of (story_slots, padded_query_vectors)
+    """
+    story_slots = np.zeros((len(data), memory_size, sentence_maxlen), dtype='int32')
+    query_vectors = []
+    targets = []
+
+    for i, sample in enumerate(data):
+        story, query = sample[0], sample[1]
+
+        # sliding window: the most recent sentences fill the last slots
+        sentences = story[-memory_size:]
+        first_slot = memory_size - len(sentences)
+        for j, sentence in enumerate(sentences):
+            vect = [word_indexes[w] for w in sentence[:sentence_maxlen]]
+            story_slots[i, first_slot + j, :len(vect)] = vect
+
+        query_vectors.append([word_indexes[w] for w in query])
+
+        if not entry:
+            targets.append(one_hot_answer(sample[2], word_indexes, answer_indexes))
+
+    queries = pad_sequences(query_vectors, maxlen=query_maxlen, padding='post', truncating='post')
+    if entry:
+        return story_slots, queries
+    return story_slots, queries, np.array(targets)
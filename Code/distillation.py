@@ -0,0 +1,222 @@
+import argparse
+import time
+from itertools import chain
+import numpy as np
+from tensorflow.keras.layers import Activation, Rescaling
+from tensorflow.keras.models import Model as KerasModel
+from Chatbot import Chatbot
+from CompactDataset import CompactDataset
+from data_processing import iter_stories
+from Model import Model
+
+
+def teacher_logits(network):
+    """
+    Builds a view of a network returning the logits of its output layer.
+
+    The networks of `Chatbot` end with `Dense` followed by a softmax `Activation`,
+    so the logits are the input of the last layer.
+
+    Args:
+        network (keras.Model): The teacher network.
+
+    Returns:
+        keras.Model: A model sharing the teacher layers and returning its logits.
+    """
+    return KerasModel(network.inputs, network.layers[-1].input)
+
+
+def soft_targets(logits, temperature):
+    """
+    Turns logits into probabilities softened by a temperature.
+
+    Args:
+        logits (np.ndarray): Logits of shape (samples, outputs).
+        temperature (float): Softmax temperature (1 gives the usual probabilities).
+
+    Returns:
+        np.ndarray: The softened probabilities.
+    """
+    scaled = logits / temperature
+    scaled -= scaled.max(axis=1, keepdims=True)
+    probabilities = np.exp(scaled)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+def known_samples(url, word_indexes):
+    """
+    Loads the samples of a bAbI file whose words all belong to a vocabulary.
+
+    Args:
+        url (str): Path to the bAbI dataset text file.
+        word_indexes (dict): The vocabulary.
+
+    Returns:
+        tuple: The dataset of the known samples, translated to the vocabulary indexes (None if
+               there is none), and the number of samples skipped for their unknown words.
+    """
+    with open(url, 'r', encoding='utf-8') as f:
+        samples = list(iter_stories(f))
+    known = [sample for sample in samples
+             if all(w in word_indexes for w in chain(chain.from_iterable(sample[0]), sample[1], [sample[2]]))]
+    if not known:
+        return None, len(samples)
+
+    data = CompactDataset.from_samples(known)
+    data.reindex(word_indexes)
+    return data, len(samples) - len(known)
+
+
+def distill(teacher, student, extra_urls=(), temperature=2.0, alpha=0.5, epochs=30, batch_size=32):
+    """
+    Trains a student chatbot on the soft targets of a trained teacher.
+
+    The student learns the hard answers (loss weight `alpha`) and the teacher distribution
+    softened by `temperature` (loss weight (1 - alpha) * temperature ** 2), which carries how
+    the teacher ranks the wrong answers too. The soft targets are matched by the student
+    logits softened by the same temperature, through a second output sharing the student
+    layers; the temperature squared keeps the gradients of both terms of the same scale.
+    Extra files (e.g. from `story_generator.py`) add samples labelled by the teacher; those
+    with words unknown to the teacher are skipped and counted.
+
+    Args:
+        teacher (Chatbot): The trained chatbot.
+        student (Chatbot): The chatbot to train, built on the same datasets.
+        extra_urls (iterable of str, optional): Additional bAbI files. Defaults to ().
+        temperature (float, optional): Softmax temperature of the teacher and the student. Defaults to 2.0.
+        alpha (float, optional): Weight of the hard answers in the loss. Defaults to 0.5.
+        epochs (int, optional): Number of training epochs. Defaults to 30.
+        batch_size (int, optional): Batch size. Defaults to 32.
+
+    Returns:
+        keras.callbacks.History: The training history of the student.
+    """
+    # the student must predict over the same outputs as the teacher
+    student.extend_vocabulary(teacher.index_words[1:], teacher.output_words if teacher.answer_head else ())
+
+    logits_network = teacher_logits(teacher.network)
+    datasets = [(teacher.train, student.train)]
+    for url in extra_urls:
+        data, skipped = known_samples(url, teacher.word_indexes)
+        if skipped:
+            print(f"{url}: {skipped} samples skipped (words unknown to the teacher)")
+        if data is not None:
+            datasets.append((data, data))
+
+    student_inputs, student_queries, hard_targets, targets = [], [], [], []
+    for teacher_data, student_data in datasets:
+        inputs, queries, answers = teacher.vectorize(teacher_data)
+        hard_targets.append(answers)
+        targets.append(soft_targets(logits_network.predict([inputs, queries], batch_size=256, verbose=0),
+                                    temperature))
+
+        inputs, queries = student.vectorize(student_data, entry=True)
+        student_inputs.append(inputs)
+        student_queries.append(queries)
+
+    inputs_test, queries_test, answers_test = student.vectorize(student.test)
+
+    # training view of the student: its answers, and its logits softened by the temperature
+    network = student.network
+    soft = Activation('softmax')(Rescaling(1 / temperature)(teacher_logits(network).outputs[0]))
+    training_network = KerasModel(network.inputs, {'answer': network.outputs[0], 'soft': soft})
+    training_network.compile(optimizer='rmsprop',
+                             loss={'answer': 'categorical_crossentropy', 'soft': 'categorical_crossentropy'},
+                             loss_weights={'answer': alpha, 'soft': (1 - alpha) * temperature ** 2},
+                             metrics={'answer': ['accuracy']})
+    return training_network.fit([np.concatenate(student_inputs), np.concatenate(student_queries)],
+                                {'answer': np.concatenate(hard_targets), 'soft': np.concatenate(targets)},
+                                batch_size=batch_size, epochs=epochs,
+                                validation_data=([inputs_test, queries_test],
+                                                 {'answer': answers_test, 'soft': answers_test}))
+
+
+def measure(chatbot, samples_nb=200):
+    """
+    Measures the test accuracy, the parameter count and the single-example latency of a chatbot.
+
+    Args:
+        chatbot (Chatbot): A trained chatbot.
+        samples_nb (int, optional): Number of test examples timed one by one. Defaults to 200.
+
+    Returns:
+        dict: "accuracy", "parameters" and "latency_ms" (median over the timed examples).
+    """
+    inputs, queries, answers = chatbot.vectorize(chatbot.test)
+    probabilities = chatbot.network.predict([inputs, queries], batch_size=256, verbose=0)
+    accuracy = float(np.mean(np.argmax(probabilities, axis=1) == np.argmax(answers, axis=1)))
+
+    # warm-up, so that graph tracing is not timed
+    chatbot.network.predict_on_batch([inputs[:1], queries[:1]])
+    latencies = []
+    for i in range(min(samples_nb, len(inputs))):
+        start = time.perf_counter()
+        chatbot.network.predict_on_batch([inputs[i:i + 1], queries[i:i + 1]])
+        latencies.append(time.perf_counter() - start)
+
+    return {'accuracy': accuracy, 'parameters': int(chatbot.network.count_params()),
+            'latency_ms': float(np.median(latencies) * 1000)}
+
+
+def format_comparison(teacher_report, student_report):
+    """
+    Formats the teacher and student measures side by side.
+
+    Args:
+        teacher_report (dict): Measures of the teacher (see `measure`).
+        student_report (dict): Measures of the student.
+
+    Returns:
+        str: A readable table.
+    """
+    lines = [f"{'':<12}{'Teacher':>12}{'Student':>12}",
+             f"{'Accuracy':<12}{teacher_report['accuracy'] * 100:>11.2f}%{student_report['accuracy'] * 100:>11.2f}%",
+             f"{'Parameters':<12}{teacher_report['parameters']:>12}{student_report['parameters']:>12}",
+             f"{'Latency':<12}{teacher_report['latency_ms']:>10.2f}ms{student_report['latency_ms']:>10.2f}ms"]
+    return '\n'.join(lines)
+
+
+def main():
+    """Command line entry point: distills the latest (or a tagged) model into a smaller one."""
+    parser = argparse.ArgumentParser(description="Distill a trained Story Bot model into a smaller student.")
+    parser.add_argument('--dataset', default="../Data/{}.txt", help="format string of the dataset files")
+    parser.add_argument('--model', default="../Network", help="directory of the model registry")
+    parser.add_argument('--tag', default=None, help="tag or name of the teacher (default: latest)")
+    parser.add_argument('--embedding-dim', type=int, default=32, help="embedding size of the student")
+    parser.add_argument('--cells', type=int, default=16, help="LSTM cells of the student (0: no LSTM)")
+    parser.add_argument('--architecture', default=None, choices=('flat', 'sentence'),
+                        help="architecture of the student (default: the teacher's)")
+    parser.add_argument('--weight-tying', default=None, choices=('adjacent', 'layerwise'),
+                        help="weight tying of the student embeddings (default: none)")
+    parser.add_argument('--extra', nargs='*', default=(), help="additional (e.g. synthetic) bAbI files")
+    parser.add_argument('--temperature', type=float, default=2.0, help="softmax temperature of the distillation")
+    parser.add_argument('--alpha', type=float, default=0.5, help="weight of the hard answers in the loss")
+    parser.add_argument('--epochs', type=int, default=30, help="training epochs of the student")
+    parser.add_argument('--student-tag', default='distilled', help="tag of the saved student")
+    parser.add_argument('--make-latest', action='store_true',
+                        help="make the student the latest model, loaded by default (default: only tagged)")
+    args = parser.parse_args()
+
+    teacher_model = Model(args.dataset, args.model, tag=args.tag)
+    teacher = teacher_model.chatbot
+    student = Chatbot(args.dataset, embedding_dim=args.embedding_dim, cells_nb=args.cells,
+                      architecture=args.architecture or teacher.architecture, answer_head=teacher.answer_head,
+                      weight_tying=args.weight_tying)
+
+    start = time.time()
+    distill(teacher, student, args.extra, args.temperature, args.alpha, args.epochs)
+    training_time = time.time() - start
+
+    teacher_report = measure(teacher)
+    student_report = measure(student)
+    print(format_comparison(teacher_report, student_report))
+
+    entry = Model.from_chatbot(student, args.model).save(
+        tags=(args.student_tag,), latest=args.make_latest, accuracy=student_report['accuracy'],
+        training_time=training_time, distilled_from=teacher_model.entry['name'],
+        parameters=student_report['parameters'], latency_ms=student_report['latency_ms'])
+    print(f"Student saved as {entry['name']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tensorflow as tf
+
+
+def configure_cpu_devices(num_devices):
+    """
+    Splits the physical CPU into several logical CPU devices.
+
+    `tf.distribute.MirroredStrategy` places one replica per device, so on a multi-socket
+    machine without GPUs the CPU has to be exposed as several logical devices first.
+    This must be called before TensorFlow initializes its runtime (i.e. before any
+    tensor is created).
+
+    Args:
+        num_devices (int): Number of logical CPU devices to create.
+
+    Returns:
+        list: The names of the logical CPU devices (e.g. ['/cpu:0', '/cpu:1']).
+    """
+    cpus = tf.config.list_physical_devices('CPU')
+    tf.config.set_logical_device_configuration(
+        cpus[0], [tf.config.LogicalDeviceConfiguration() for _ in range(num_devices)]
+    )
+    return [device.name for device in tf.config.list_logical_devices('CPU')]
+
+
+def get_strategy(mode='mirrored', num_devices=None):
+    """
+    Creates the `tf.distribute` strategy used by `Chatbot.train_model`.
+
+    - "mirrored": synchronous data parallelism across the logical CPU devices of this process.
+    - "multi_worker": synchronous data parallelism across processes, each one described
+      by the `TF_CONFIG` environment variable (see `launch_local_cluster`).
+
+    Args:
+        mode (str, optional): "mirrored" or "multi_worker". Defaults to "mirrored".
+        num_devices (int, optional): Number of logical CPU devices for the mirrored mode.
+                                     Defaults to None (use the devices already configured).
+
+    Returns:
+        tf.distribute.Strategy: The distribution strategy.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode == 'mirrored':
+        devices = configure_cpu_devices(num_devices) if num_devices else None
+        strategy = tf.distribute.MirroredStrategy(devices=devices)
+    elif mode == 'multi_worker':
+        strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    else:
+        raise ValueError(f"Unknown distribution mode: {mode}")
+
+    return strategy
+
+
+def is_chief(strategy):
+    """
+    Tells whether the current process is in charge of saving the trained model.
+
+    Args:
+        strategy (tf.distribute.Strategy or None): The strategy used for training.
+
+    Returns:
+        bool: False only for the non-chief workers of a multi-worker cluster.
+    """
+    resolver = getattr(strategy, 'cluster_resolver', None)
+    if resolver is None or not resolver.task_type:
+        return True
+    return resolver.task_type == 'chief' or (resolver.task_type == 'worker' and resolver.task_id == 0)
+
+
+def to_sharded_dataset(strategy, inputs, targets, global_batch_size, shuffle=False):
+    """
+    Wraps vectorized arrays into a distributed `tf.data` dataset, sharded before shuffling.
+
+    Each input pipeline (one per worker) keeps every N-th sample of the arrays, N being the
+    number of pipelines, so the workers train on disjoint subsets covering all the samples;
+    only then is its shard shuffled and batched with the per-replica batch size. Sharding
+    after an unseeded shuffle (the DATA auto-shard policy) would give overlapping subsets.
+
+    The shards are repeated and the number of steps of an epoch is returned with the dataset:
+    Keras cannot infer it from a distributed dataset, and all the workers must run the same
+    number of steps even when their shards differ by one sample.
+
+    Args:
+        strategy (tf.distribute.Strategy): The strategy used for training.
+        inputs (tuple): The story and query arrays returned by `vectorization`.
+        targets (np.ndarray): The one-hot answer array.
+        global_batch_size (int): Batch size summed over all replicas.
+        shuffle (bool, optional): Whether to shuffle the samples each epoch. Defaults to False.
+
+    Returns:
+        tuple: The batched, prefetched `tf.distribute.DistributedDataset` and the number of steps per epoch.
+    """
+    def dataset_fn(input_context):
+        dataset = tf.data.Dataset.from_tensor_slices((inputs, targets))
+        dataset = dataset.shard(input_context.num_input_pipelines, input_context.input_pipeline_id)
+        if shuffle:
+            dataset = dataset.shuffle(len(targets), reshuffle_each_iteration=True)
+        batch_size = input_context.get_per_replica_batch_size(global_batch_size)
+        return dataset.repeat().batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    steps = max(1, -(-len(targets) // global_batch_size))
+    return strategy.distribute_datasets_from_function(dataset_fn), steps
+
+
+def launch_local_cluster(num_workers, path_dataset, path_model, architecture='flat', tag=None, reuse=False,
+                         base_port=12345):
+    """
+    Launches a multi-worker training cluster made of local processes.
+
+    Each worker is started as `python distribution.py --worker ...` with its own
+    `TF_CONFIG` (holding its index), all of them listening on consecutive ports of
+    localhost. The worker with index 0 acts as chief and saves the trained model.
+
+    Args:
+        num_workers (int): Number of worker processes.
+        path_dataset (str): Format string of the dataset files (e.g. "../Data/{}.txt").
+        path_model (str): Directory of the model registry, as given to `Model`.
+        architecture (str, optional): Architecture of the network. Defaults to "flat".
+        tag (str, optional): Tag of the trained model. Defaults to None.
+        reuse (bool, optional): Load the registered model instead of training one (see `main`). Defaults to False.
+        base_port (int, optional): First port used by the cluster. Defaults to 12345.
+
+    Returns:
+        list: The exit codes of the workers.
+    """
+    cluster = {'worker': [f"localhost:{base_port + i}" for i in range(num_workers)]}
+    script = os.path.abspath(__file__)
+
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env['TF_CONFIG'] = json.dumps({'cluster': cluster, 'task': {'type': 'worker', 'index': index}})
+        command = [sys.executable, script, '--worker', '--dataset', path_dataset, '--model', path_model,
+                   '--architecture', architecture]
+        if tag:
+            command += ['--tag', tag]
+        if reuse:
+            command.append('--reuse')
+        processes.append(subprocess.Popen(command, env=env, cwd=os.path.dirname(script)))
+
+    return [process.wait() for process in processes]
+
+
+def main():
+    """Command line entry point to train with a mirrored strategy or a local multi-worker cluster."""
+    parser = argparse.ArgumentParser(description="Data-parallel training of the Story Bot network.")
+    parser.add_argument('--dataset', default="../Data/{}.txt", help="format string of the dataset files")
+    parser.add_argument('--model', default="../Network", help="directory of the model registry")
+    parser.add_argument('--devices', type=int, default=2, help="logical CPU devices (mirrored mode)")
+    parser.add_argument('--workers', type=int, default=0, help="local worker processes (multi-worker mode)")
+    parser.add_argument('--architecture', default='flat', choices=('flat', 'sentence'), help="network architecture")
+    parser.add_argument('--tag', default=None, help="tag of the trained model")
+    parser.add_argument('--reuse', action='store_true',
+                        help="load the latest (or tagged) registered model instead of training a new one")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.workers:
+        sys.exit(max(launch_local_cluster(args.workers, args.dataset, args.model, args.architecture, args.tag,
+                                          args.reuse)))
+
+    # imported here so that the launcher process does not build the datasets itself
+    from Model import Model
+
+    if args.worker:
+        strategy = get_strategy('multi_worker')
+    else:
+        strategy = get_strategy('mirrored', args.devices)
+
+    # a fresh run by default: the registry usually holds a model already (e.g. the bundled one)
+    Model(args.dataset, args.model, strategy=strategy, architecture=args.architecture, tag=args.tag,
+          retrain=not args.reuse)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import time
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Input
+from tensorflow.keras.models import Model as KerasModel
+from data_processing import transform_entry
+from helpers import get_vocabulary_hash
+from inference import format_predictions
+from layers import EnsembleCombine
+from Model import Model
+from ModelRegistry import ModelRegistry
+
+
+class Ensemble:
+    """
+    Several saved memory networks fused into a single inference graph.
+
+    The members share the inputs of the fused graph and their answer distributions are
+    combined inside it (see `layers.EnsembleCombine`), so a batch goes through every
+    member in one `predict` call: one vectorization, one graph execution in which
+    TensorFlow can run the members in parallel, one decoding.
+
+    The members must have been trained on the same vocabulary, with the same architecture
+    and padding lengths, e.g. networks of a same configuration trained with different seeds.
+
+    Attributes:
+        chatbot (Chatbot): Chatbot holding the vocabulary shared by the members.
+        members (list of str): Registry names of the members.
+        network (keras.Model): The fused network, returning the combined distribution.
+    """
+    chatbot = None
+    members = None
+    network = None
+
+    def __init__(self, path_textfiles, model_dir, members, method='average'):
+        """
+        Loads the members from the registry and fuses them.
+
+        Args:
+            path_textfiles (str): Path pattern to the training and test text files.
+            model_dir (str): Directory of the model registry.
+            members (iterable of str): Tags or names of the models to combine.
+            method (str, optional): "average" or "vote" (see `layers.EnsembleCombine`). Defaults to "average".
+
+        Raises:
+            ValueError: If a member is unknown or incompatible with the first one, or the method is unknown.
+        """
+        if method not in ('average', 'vote'):
+            raise ValueError(f"Unknown ensemble method: {method}")
+
+        # unknown members are rejected before anything is loaded (`Model` would train them)
+        registry = ModelRegistry(model_dir)
+        entries = []
+        for tag in members:
+            entries.append(registry.get(tag))
+            if entries[-1] is None:
+                raise ValueError(f"Unknown model: {tag}")
+
+        model = Model(path_textfiles, model_dir, tag=entries[0]['name'])
+        self.chatbot = model.chatbot
+        self.members = [model.entry['name']]
+        networks = [self.chatbot.network]
+        outputs = list(self.chatbot.output_words)
+        vocabulary_hash = get_vocabulary_hash(self.chatbot.word_indexes)
+
+        for entry in entries[1:]:
+            # every member is loaded into the chatbot of the first one, which keeps its architecture and outputs
+            for key, default in (('architecture', 'flat'), ('answer_head', False)):
+                if entry.get(key, default) != entries[0].get(key, default):
+                    raise ValueError(f"Model {entry['name']} has another {key.replace('_', ' ')} "
+                                     f"than {self.members[0]}")
+            model.load(entry)
+
+            network = self.chatbot.network
+            # members with an answer head share their outputs, but their word indexes must also agree
+            if get_vocabulary_hash(self.chatbot.word_indexes) != vocabulary_hash:
+                raise ValueError(f"Model {entry['name']} has another vocabulary than {self.members[0]}")
+            if [tuple(i.shape) for i in network.inputs] != [tuple(i.shape) for i in networks[0].inputs]:
+                raise ValueError(f"Model {entry['name']} has other input shapes than {self.members[0]}")
+            if network.outputs[0].shape[-1] != networks[0].outputs[0].shape[-1] \
+                    or list(self.chatbot.output_words) != outputs:
+                raise ValueError(f"Model {entry['name']} has other outputs than {self.members[0]}")
+
+            self.members.append(entry['name'])
+            networks.append(network)
+
+        # the members become layers of the fused graph; they need distinct names
+        inputs = [Input(tuple(i.shape[1:])) for i in networks[0].inputs]
+        distributions = [KerasModel(network.inputs, network.outputs[0], name=f"member_{i}")(inputs)
+                         for i, network in enumerate(networks)]
+        self.network = KerasModel(inputs, EnsembleCombine(method)(distributions))
+
+    def predict_batch(self, stories, questions, batch_size=32):
+        """
+        Predicts the answers of several story-question pairs with all the members at once.
+
+        Args:
+            stories (list of str): The context or story texts.
+            questions (list of str): The questions, one per story.
+            batch_size (int, optional): Number of pairs per inference batch. Defaults to 32.
+
+        Returns:
+            list of tuple: For each pair, the refined answer and its combined score (0-100):
+                           the averaged probability, or the share of the members voting for it.
+        """
+        flatten = self.chatbot.architecture == 'flat'
+        entries = [transform_entry(story, question, flatten=flatten)[0] for story, question in zip(stories, questions)]
+        inputs, queries = self.chatbot.vectorize(entries, entry=True)
+
+        probabilities = self.network.predict([inputs, queries], batch_size=batch_size, verbose=0)
+        return format_predictions(entries, questions, probabilities, self.chatbot.output_words)
+
+    def predict(self, story, question):
+        """
+        Predicts the answer of one story-question pair (see `predict_batch`).
+
+        Args:
+            story (str): The context or story text.
+            question (str): The question related to the story.
+
+        Returns:
+            tuple[str, float]: The refined answer and its combined score (0-100).
+        """
+        return self.predict_batch([story], [question], batch_size=1)[0]
+
+
+def train_members(path_textfiles, model_dir, seeds, architecture='flat'):
+    """
+    Trains (or loads, if already registered) one model per seed, tagged "seed-<seed>".
+
+    Args:
+        path_textfiles (str): Path pattern to the training and test text files.
+        model_dir (str): Directory of the model registry.
+        seeds (iterable of int): Seeds of the members.
+        architecture (str, optional): Architecture of the members. Defaults to "flat".
+
+    Returns:
+        list of str: The tags of the members.
+    """
+    tags = []
+    for seed in seeds:
+        tf.keras.utils.set_random_seed(seed)
+        tags.append(f"seed-{seed}")
+        Model(path_textfiles, model_dir, architecture=architecture, tag=tags[-1])
+    return tags
+
+
+def main():
+    """Command line entry point: compares an ensemble with its members on the test set."""
+    parser = argparse.ArgumentParser(description="Combine several trained Story Bot models into one ensemble.")
+    parser.add_argument('members', nargs='*', help="tags or names of the models to combine")
+    parser.add_argument('--dataset', default="../Data/{}.txt", help="format string of the dataset files")
+    parser.add_argument('--model', default="../Network", help="directory of the model registry")
+    parser.add_argument('--method', default='average', choices=('average', 'vote'), help="combination method")
+    parser.add_argument('--seeds', type=int, default=0, help="train (or reuse) this many seeded members instead")
+    parser.add_argument('--architecture', default='flat', choices=('flat', 'sentence'),
+                        help="architecture of the seeded members")
+    args = parser.parse_args()
+
+    members = args.members or train_members(args.dataset, args.model, range(args.seeds), args.architecture)
+    if len(members) < 2:
+        parser.error("an ensemble needs at least two members")
+
+    ensemble = Ensemble(args.dataset, args.model, members, args.method)
+    inputs, queries, answers = ensemble.chatbot.vectorize(ensemble.chatbot.test)
+    expected = np.argmax(answers, axis=1)
+
+    for i, name in enumerate(ensemble.members):
+        member = ensemble.network.get_layer(f"member_{i}")
+        predicted = np.argmax(member.predict([inputs, queries], batch_size=256, verbose=0), axis=1)
+        print(f"{name}: accuracy = {np.mean(predicted == expected) * 100:.2f}%")
+
+    start = time.perf_counter()
+    predicted = np.argmax(ensemble.network.predict([inputs, queries], batch_size=256, verbose=0), axis=1)
+    elapsed = time.perf_counter() - start
+    print(f"ensemble ({args.method}, {len(members)} members): accuracy = {np.mean(predicted == expected) * 100:.2f}% "
+          f"in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+from itertools import chain, islice
+import numpy as np
+from data_processing import iter_stories
+from Model import Model
+from ModelRegistry import ModelRegistry
+
+
+def shard_ranges(url, workers_nb):
+    """
+    Splits a bAbI file into byte ranges of about the same size, one per worker.
+
+    Every range starts at the beginning of a story (a line numbered 1), so the workers can
+    parse their ranges independently. Only a few lines around each boundary are read.
+
+    Args:
+        url (str): Path to the bAbI dataset text file.
+        workers_nb (int): Number of ranges.
+
+    Returns:
+        list of tuple: The (start, end) byte offsets of each range (some may be empty).
+    """
+    size = os.path.getsize(url)
+    boundaries = [0]
+    with open(url, 'rb') as f:
+        for i in range(1, workers_nb):
+            # skip to the first story starting after the even split point
+            f.seek(max(i * size // workers_nb, boundaries[-1]))
+            if f.tell():
+                f.readline()
+            position = f.tell()
+            line = f.readline()
+            while line and not line.startswith(b'1 '):
+                position = f.tell()
+                line = f.readline()
+            boundaries.append(position if line else size)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def iter_lines(url, start=0, end=None):
+    """
+    Streams the decoded lines of a byte range of a file.
+
+    Args:
+        url (str): Path to the file.
+        start (int, optional): Offset of the first line. Defaults to 0.
+        end (int, optional): Offset after the last line. Defaults to None (end of the file).
+
+    Yields:
+        str: The lines.
+    """
+    with open(url, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                return
+            position += len(line)
+            yield line.decode('utf-8')
+
+
+def iter_batches(url, batch_size, start=0, end=None):
+    """
+    Streams the samples of a byte range of a bAbI file by batches.
+
+    Args:
+        url (str): Path to the bAbI dataset text file.
+        batch_size (int): Number of samples per batch.
+        start (int, optional): Offset of the range, at the beginning of a story (see `shard_ranges`).
+                               Defaults to 0.
+        end (int, optional): End of the range. Defaults to None (end of the file).
+
+    Yields:
+        list: Batches of (sentences, question, answer) samples.
+    """
+    samples = iter_stories(iter_lines(url, start, end))
+    batch = list(islice(samples, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(samples, batch_size))
+
+
+def question_type(question):
+    """
+    Returns the type of a tokenized question, i.e. its interrogative word ("where", "what", "why", ...).
+
+    Args:
+        question (list of str): The tokenized question.
+
+    Returns:
+        str: The lowercased first token of the question.
+    """
+    return question[0].lower() if question else ''
+
+
+def evaluate_shard(path_dataset, model_dir, model_name, url, batch_size, start=0, end=None):
+    """
+    Evaluates a saved model on one shard of a bAbI file.
+
+    The model is loaded through `Model` in the calling process, so that every worker
+    has its own copy of the network, and the shard, a byte range computed by the parent
+    (see `shard_ranges`), is the only part of the file the worker reads and parses; it is
+    streamed through batched inference. Samples containing words unknown to the model
+    vocabulary are counted and skipped.
+
+    Args:
+        path_dataset (str): Format string of the training files, needed to rebuild the vocabulary.
+        model_dir (str): Directory of the model registry.
+        model_name (str): Name (or tag) of the model in the registry.
+        url (str): Path to the bAbI file to evaluate on.
+        batch_size (int): Number of samples per inference batch.
+        start (int, optional): Offset of the shard in the file. Defaults to 0.
+        end (int, optional): End of the shard. Defaults to None (end of the file).
+
+    Returns:
+        dict: The counts of the shard ("total", "correct", "skipped", "types", "confusion")
+              and the time spent in inference ("inference_time").
+    """
+    chatbot = Model(path_dataset, model_dir, tag=model_name).chatbot
+    vocabulary = chatbot.word_indexes
+
+    results = {'total': 0, 'correct': 0, 'skipped': 0, 'inference_time': 0.0,
+               'types': {}, 'confusion': Counter()}
+
+    for batch in iter_batches(url, batch_size, start, end):
+        known = [sample for sample in batch
+                 if all(w in vocabulary for w in chain(chain.from_iterable(sample[0]), sample[1], [sample[2]]))]
+        results['skipped'] += len(batch) - len(known)
+        if not known:
+            continue
+
+        if chatbot.architecture == 'flat':
+            entries = [(list(chain.from_iterable(story)), q) for story, q, _ in known]
+        else:
+            entries = [(story, q) for story, q, _ in known]
+
+        started = time.perf_counter()
+        stories, queries = chatbot.vectorize(entries, entry=True)
+        probabilities = chatbot.network.predict([stories, queries], batch_size=batch_size, verbose=0)
+        results['inference_time'] += time.perf_counter() - started
+
+        for (_, q, answer), index in zip(known, np.argmax(probabilities, axis=1)):
+            prediction = chatbot.output_words[index]
+            correct = prediction == answer
+
+            results['total'] += 1
+            results['correct'] += correct
+            type_counts = results['types'].setdefault(question_type(q), [0, 0])
+            type_counts[0] += correct
+            type_counts[1] += 1
+            results['confusion'][(answer, prediction)] += 1
+
+    return results
+
+
+def _evaluate_shard(arguments):
+    """Unpacks the arguments of `evaluate_shard` for `multiprocessing.Pool.map`."""
+    return evaluate_shard(*arguments)
+
+
+def merge_results(shards):
+    """
+    Sums the counts of several shards.
+
+    Args:
+        shards (list of dict): Results returned by `evaluate_shard`.
+
+    Returns:
+        dict: The merged results.
+    """
+    merged = {'total': 0, 'correct': 0, 'skipped': 0, 'inference_time': 0.0, 'types': {}, 'confusion': Counter()}
+    for shard in shards:
+        for key in ('total', 'correct', 'skipped', 'inference_time'):
+            merged[key] += shard[key]
+        for q_type, (correct, total) in shard['types'].items():
+            type_counts = merged['types'].setdefault(q_type, [0, 0])
+            type_counts[0] += correct
+            type_counts[1] += total
+        merged['confusion'].update(shard['confusion'])
+    return merged
+
+
+def evaluate(path_dataset, model_dir, url, tag=None, batch_size=256, workers_nb=1):
+    """
+    Evaluates a saved model on a bAbI file, possibly with several worker processes.
+
+    Args:
+        path_dataset (str): Format string of the training files (e.g. "../Data/{}.txt").
+        model_dir (str): Directory of the model registry.
+        url (str): Path to the bAbI file to evaluate on.
+        tag (str, optional): Tag or name of the model. Defaults to None (latest model).
+        batch_size (int, optional): Number of samples per inference batch. Defaults to 256.
+        workers_nb (int, optional): Number of worker processes. Defaults to 1 (in process).
+
+    Returns:
+        dict: The report: overall and per-question-type accuracy, confusion matrix
+              ({answer: {prediction: count}}) and throughput in examples per second.
+
+    Raises:
+        ValueError: If the registry holds no such model.
+    """
+    registry = ModelRegistry(model_dir)
+    entry = registry.get(tag) if tag else registry.latest()
+    if entry is None:
+        raise ValueError(f"No model to evaluate in {model_dir}")
+
+    start = time.perf_counter()
+    if workers_nb == 1:
+        shards = [evaluate_shard(path_dataset, model_dir, entry['name'], url, batch_size)]
+    else:
+        # TensorFlow is not fork-safe: every worker starts a fresh interpreter
+        arguments = [(path_dataset, model_dir, entry['name'], url, batch_size, start, end)
+                     for start, end in shard_ranges(url, workers_nb)]
+        with multiprocessing.get_context('spawn').Pool(workers_nb) as pool:
+            shards = pool.map(_evaluate_shard, arguments)
+    elapsed = time.perf_counter() - start
+
+    results = merge_results(shards)
+    confusion = {}
+    for (answer, prediction), count in sorted(results['confusion'].items()):
+        confusion.setdefault(answer, {})[prediction] = count
+
+    return {
+        'model': entry['name'],
+        'examples': results['total'],
+        'skipped': results['skipped'],
+        'accuracy': results['correct'] / results['total'] if results['total'] else 0.0,
+        'accuracy_by_type': {q_type: {'accuracy': correct / total, 'examples': total}
+                             for q_type, (correct, total) in sorted(results['types'].items())},
+        'confusion': confusion,
+        'examples_per_second': results['total'] / elapsed if elapsed else 0.0,
+        'inference_examples_per_second': (results['total'] / results['inference_time']
+                                          if results['inference_time'] else 0.0),
+    }
+
+
+def format_report(report):
+    """
+    Formats an evaluation report as readable text tables.
+
+    Args:
+        report (dict): Report returned by `evaluate`.
+
+    Returns:
+        str: The formatted report.
+    """
+    lines = [f"Model: {report['model']}",
+             f"Examples: {report['examples']} (skipped, unknown words: {report['skipped']})",
+             f"Accuracy: {report['accuracy'] * 100:.2f}%",
+             f"Throughput: {report['examples_per_second']:.1f} examples/s "
+             f"({report['inference_examples_per_second']:.1f} examples/s in inference)",
+             "",
+             f"{'Question type':<15}{'Examples':>10}{'Accuracy':>10}"]
+    for q_type, values in report['accuracy_by_type'].items():
+        lines.append(f"{q_type:<15}{values['examples']:>10}{values['accuracy'] * 100:>9.2f}%")
+
+    predictions = sorted({p for row in report['confusion'].values() for p in row})
+    width = max([len(w) for w in predictions + list(report['confusion'])] + [8]) + 2
+    lines += ["", "Confusion matrix (rows: answer, columns: prediction)",
+              ' ' * width + ''.join(f"{p:>{width}}" for p in predictions)]
+    for answer, row in report['confusion'].items():
+        lines.append(f"{answer:<{width}}" + ''.join(f"{row.get(p, 0):>{width}}" for p in predictions))
+
+    return '\n'.join(lines)
+
+
+def main():
+    """Command line entry point of the evaluation harness."""
+    parser = argparse.ArgumentParser(description="Batched evaluation of a saved Story Bot model.")
+    parser.add_argument('file', help="bAbI file to evaluate on")
+    parser.add_argument('--dataset', default="../Data/{}.txt", help="format string of the training files")
+    parser.add_argument('--model', default="../Network", help="directory of the model registry")
+    parser.add_argument('--tag', default=None, help="tag or name of the model (default: latest)")
+    parser.add_argument('--batch-size', type=int, default=256, help="inference batch size")
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('--json', default=None, help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = evaluate(args.dataset, args.model, args.file, args.tag, args.batch_size, args.workers)
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
-import os
+import hashlib
+import json
 import string
 import sys
 import nltk
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
 
 try:
     from nltk.corpus import words
@@ -31,6 +35,127 @@ except LookupError:
 ENGLISH_WORDS = set(w.lower() for w in words.words())
 
 
+class DatasetStatistics:
+    """
+    Streaming statistics collector fed by the parser while it reads the dataset files.
+
+    `extract_stories` calls `add_sentence` for every story line (once, even though the
+    sentence belongs to the context of several questions) and `add_sample` for every
+    question, so the vocabulary, the length distributions and the answer set are built
+    in a single pass without materializing any concatenated dataset. Lengths are kept as
+    histograms, whose size only depends on the number of distinct lengths.
+
+    Attributes:
+        word_counts (Counter): Number of occurrences of each word (stories, questions and answers).
+        answers (Counter): Number of occurrences of each answer.
+        story_lengths (Counter): Histogram of the number of tokens of the stories.
+        memory_lengths (Counter): Histogram of the number of sentences of the stories.
+        sentence_lengths (Counter): Histogram of the number of tokens of the sentences.
+        query_lengths (Counter): Histogram of the number of tokens of the questions.
+    """
+    word_counts = None
+    answers = None
+    story_lengths = None
+    memory_lengths = None
+    sentence_lengths = None
+    query_lengths = None
+
+    def __init__(self):
+        """Initializes empty counters."""
+        self.word_counts = Counter()
+        self.answers = Counter()
+        self.story_lengths = Counter()
+        self.memory_lengths = Counter()
+        self.sentence_lengths = Counter()
+        self.query_lengths = Counter()
+
+    def add_sentence(self, sentence):
+        """
+        Records a new story sentence.
+
+        Args:
+            sentence (list of str): The tokenized sentence.
+        """
+        self.word_counts.update(sentence)
+        self.sentence_lengths[len(sentence)] += 1
+
+    def add_sample(self, story, question, answer):
+        """
+        Records a story-question-answer sample whose sentences were already given to `add_sentence`.
+
+        Args:
+            story (list of list of str): The tokenized sentences of the story.
+            question (list of str): The tokenized question.
+            answer (str): The answer.
+        """
+        self.story_lengths[sum(map(len, story))] += 1
+        self.memory_lengths[len(story)] += 1
+        self.query_lengths[len(question)] += 1
+        self.word_counts.update(question)
+        self.word_counts[answer] += 1
+        self.answers[answer] += 1
+
+    def vocabulary(self):
+        """Returns the sorted list of unique words seen so far."""
+        return sorted(self.word_counts)
+
+    @staticmethod
+    def percentile(histogram, q):
+        """
+        Computes a percentile (nearest-rank method) from a length histogram.
+
+        Args:
+            histogram (Counter): Mapping from a length to its number of occurrences.
+            q (float): Percentile between 0 and 100 (100 gives the maximum).
+
+        Returns:
+            int: The smallest length such that at least q% of the values are lower or equal.
+        """
+        if not histogram:
+            return 0
+
+        rank = q / 100 * sum(histogram.values())
+        seen = 0
+        for length in sorted(histogram):
+            seen += histogram[length]
+            if seen >= rank:
+                return length
+        return max(histogram)
+
+    def story_maxlength(self, q=100):
+        """Returns the q-th percentile of the number of tokens per story (maximum by default)."""
+        return self.percentile(self.story_lengths, q)
+
+    def memory_maxlength(self, q=100):
+        """Returns the q-th percentile of the number of sentences per story (maximum by default)."""
+        return self.percentile(self.memory_lengths, q)
+
+    def sentence_maxlength(self, q=100):
+        """Returns the q-th percentile of the number of tokens per sentence (maximum by default)."""
+        return self.percentile(self.sentence_lengths, q)
+
+    def query_maxlength(self, q=100):
+        """Returns the q-th percentile of the number of tokens per question (maximum by default)."""
+        return self.percentile(self.query_lengths, q)
+
+    @classmethod
+    def from_samples(cls, samples):
+        """
+        Builds the statistics of already parsed samples whose stories are flat token lists.
+
+        Args:
+            samples (iterable): Tuples (story, question, answer).
+
+        Returns:
+            DatasetStatistics: The collected statistics.
+        """
+        stats = cls()
+        for story, q, answer in samples:
+            stats.add_sentence(story)
+            stats.add_sample([story], q, answer)
+        return stats
+
+
 def get_vocab(train, test):
     """
     Builds the vocabulary set from the training and test datasets.
@@ -45,11 +170,7 @@ def get_vocab(train, test):
     Returns:
         list: A sorted list of unique words from the combined datasets.
     """
-    vocab = set()
-    for story, q, answer in train + test:
-        new_story = story + q + [answer]
-        vocab |= set(new_story)
-    return sorted(vocab)
+    return DatasetStatistics.from_samples(chain(train, test)).vocabulary()
 
 
 def create_word_indexes(vocab):
@@ -81,6 +202,8 @@ def get_hyperparameters(train, test):
     - Computes the maximum length of the questions.
 
     These values are useful for setting input dimensions in the neural network.
+    `Chatbot` gets them directly from the `DatasetStatistics` filled while parsing;
+    this function computes them for samples that were parsed without it.
 
     Args:
         train (list): A list of training samples, each as a tuple (story, question, answer).
@@ -92,44 +215,83 @@ def get_hyperparameters(train, test):
             - story_maxlen (int): Maximum number of tokens in any story.
             - query_maxlen (int): Maximum number of tokens in any question.
     """
-    vocab = get_vocab(train, test)
+    stats = DatasetStatistics.from_samples(chain(train, test))
+    return stats.vocabulary(), stats.story_maxlength(), stats.query_maxlength()
+
+
+def get_vocabulary_hash(word_indexes):
+    """
+    Computes a fingerprint of a vocabulary and its indexes.
+
+    Two networks can only share weights if every word has the same index, so the
+    hash is stored with each saved model and checked when it is loaded.
+
+    Args:
+        word_indexes (dict): Dictionary mapping words to their indices.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the (word, index) pairs.
+    """
+    content = '\n'.join(f"{word}\t{index}" for word, index in sorted(word_indexes.items(), key=lambda x: x[1]))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_configuration_hash(configuration):
+    """
+    Computes a short fingerprint of a network configuration.
+
+    Args:
+        configuration (dict): JSON-serializable description of the network (hyperparameters, shapes...).
 
-    # the overall dataset
-    whole_data = train + test
+    Returns:
+        str: The first 12 hexadecimal digits of the SHA-256 digest of the sorted JSON encoding.
+    """
+    content = json.dumps(configuration, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
 
-    # apply len to all stories and get the max of it
-    story_maxlen = max(map(len, (x for x, _, _ in whole_data)))
 
-    # do the same to queries
-    query_maxlen = max(map(len, (x for _, x, _ in whole_data)))
+# Templates of the refined answers, by question type
+ANSWER_TEMPLATES = {
+    'where': "{person} is in the {answer}",
+    'why': "Because he/she is {answer}",
+    'what': "The {answer}{rest}",
+}
 
-    return vocab, story_maxlen, query_maxlen
+# Translation table removing the punctuation, built once
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
 
 
-def get_new_modelname(working_path):
+@lru_cache(maxsize=4096)
+def answer_template(question):
     """
-    Generates a new model name by incrementing the highest existing model number in the directory.
+    Analyzes a question once and returns how to render the answers to it.
 
-    The function looks for JSON files in the given directory with names like 'model1.json',
-    'model2.json', etc., and returns a new model name with the next incremented number.
-    If no such files exist, it returns 'model1'.
+    The result only depends on the question, so it is memoized: the case folding, the
+    entity extraction and the template choice run once per distinct question.
 
     Args:
-        working_path (str): Path to the directory containing model files.
+        question (str): The input question string (e.g. "Where is Mary?").
 
     Returns:
-        str: The new model name without the file extension (e.g., 'model3').
+        tuple: The template (see `ANSWER_TEMPLATES`) and its question-dependent fields,
+               or (None, None) when the raw prediction is returned.
     """
-    listdir = os.listdir(working_path)
-    model_names = sorted([name for name in listdir if 'json' in name])
-    if len(model_names) == 0:
-        model_name = "model1"
-    else:
-        last_name = model_names[-1]
-        last_id = int(last_name.split('.')[0][-1])
-        model_name = "model" + str(last_id + 1)
+    q_lower = question.lower()
 
-    return model_name
+    # Try to determine person’s name
+    person = list(extract_person(question))
+
+    if len(person):
+        if q_lower.startswith("where"):
+            return ANSWER_TEMPLATES['where'], {'person': person[0]}
+
+    elif q_lower.startswith("why"):
+        return ANSWER_TEMPLATES['why'], {}
+
+    elif q_lower.startswith("what") and not q_lower.replace(" ?", "").endswith("of"):
+        return ANSWER_TEMPLATES['what'], {'rest': q_lower.replace("what", "").replace("?", "")}
+
+    return None, None
 
 
 def affine_answer(question, prediction):
@@ -138,10 +300,12 @@ def affine_answer(question, prediction):
     and inserting the relevant person’s name.
 
     - For "where" questions, returns:
-          "<optional reversed context>in the <prediction>"
+          "<PersonName> is in the <prediction>"
     - For "why" questions, returns:
-          "Because <PersonName> is <prediction>"
-    - Otherwise, returns the raw prediction capitalized.
+          "Because he/she is <prediction>"
+    - For "what" questions, returns:
+          "The <prediction><rest of the question>"
+    - Otherwise, returns the raw prediction.
 
     Args:
         question (str): The input question string (e.g. "Where is Mary?").
@@ -150,24 +314,34 @@ def affine_answer(question, prediction):
     Returns:
         str: The refined, human-readable answer.
     """
-    # Lowercase prediction for consistent formatting
-    reponse = prediction
-    q_lower = question.lower()
+    template, fields = answer_template(question)
+    if template is None:
+        return prediction
+    return template.format(answer=prediction.lower(), **fields)
 
-    # Try to determine person’s name
-    person = list(extract_person(question))
 
-    if len(person):
-        if q_lower.startswith("where"):
-            reponse = f"{person[0]} is in the {prediction.lower()}"
+def affine_answers(questions, predictions):
+    """
+    Refines the predictions of a whole batch (see `affine_answer`).
 
-    elif q_lower.startswith("why"):
-        reponse = f"Because he/she is {prediction.lower()}"
+    Each distinct question is analyzed once and each distinct (question, prediction)
+    pair rendered once, which matters when many samples share their question.
 
-    elif q_lower.startswith("what") and not q_lower.replace(" ?", "").endswith("of"):
-        reponse = f"The {prediction.lower()}{question.lower().replace("what", "").replace("?", "")}"
+    Args:
+        questions (iterable of str): The input questions.
+        predictions (iterable of str): The raw answer predicted for each question.
 
-    return reponse
+    Returns:
+        list of str: The refined answers, in order.
+    """
+    rendered = {}
+    answers = []
+    for pair in zip(questions, predictions):
+        answer = rendered.get(pair)
+        if answer is None:
+            answer = rendered[pair] = affine_answer(*pair)
+        answers.append(answer)
+    return answers
 
 
 def extract_person(text):
@@ -179,19 +353,26 @@ def extract_person(text):
     1. It first tries to extract capitalized words (excluding the first word) which are often proper nouns.
     2. If none are found, it computes the difference between all words (punctuation removed) and a set of known English words.
 
+    Results are memoized per sentence.
+
     Args:
         text (str): The input sentence or question.
 
     Returns:
         set: A set of candidate entity names not found in the English dictionary.
     """
+    return set(_extract_person(text))
+
+
+@lru_cache(maxsize=4096)
+def _extract_person(text):
+    """Memoized implementation of `extract_person`, returning a frozenset."""
     # Heuristic 1: Capitalized words, excluding the first word (common in questions like "What is ...")
     unknown_words = {word for i, word in enumerate(text.split()) if i != 0 and word.istitle()}
 
     # Fallback: Difference with English dictionary
     if not unknown_words:
-        clean_text = text.translate(str.maketrans('', '', string.punctuation)).lower()
-        tokens = set(clean_text.split())
+        tokens = set(text.translate(PUNCTUATION_TABLE).lower().split())
         unknown_words = tokens - ENGLISH_WORDS
 
-    return unknown_words
+    return frozenset(unknown_words)
@@ -0,0 +1,217 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import clone_model
+from helpers import affine_answers
+from data_processing import transform_entry, vectorization, vectorization_sentences
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Sets the number of threads TensorFlow uses inside an operation and between operations.
+
+    Like `distribution.configure_cpu_devices`, this must be called before TensorFlow
+    initializes its runtime, i.e. before any `Chatbot` or `Model` is built (see `main`).
+
+    Args:
+        intra_op_threads (int, optional): Threads used to run one operation (e.g. a matrix product).
+                                          Defaults to None (unchanged).
+        inter_op_threads (int, optional): Independent operations run in parallel. Defaults to None (unchanged).
+
+    Raises:
+        RuntimeError: If the runtime is already initialized with other values.
+    """
+    if intra_op_threads is not None and intra_op_threads != tf.config.threading.get_intra_op_parallelism_threads():
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads is not None and inter_op_threads != tf.config.threading.get_inter_op_parallelism_threads():
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def format_predictions(entries, questions, probabilities, output_words, attentions=None, flatten=True):
+    """
+    Decodes the answer distributions of a batch into refined answers and confidence scores.
+
+    Args:
+        entries (list of tuple): The (story tokens, question tokens) of each pair, from `transform_entry`.
+        questions (list of str): The questions.
+        probabilities (np.ndarray): Answer distributions of shape (pairs, outputs).
+        output_words (sequence of str): Word of each output of the network.
+        attentions (np.ndarray, optional): Attention weights to return with the answers,
+                                           trimmed to the actual stories. Defaults to None.
+        flatten (bool, optional): True for the flat architecture, whose attention also
+                                  covers the question tokens. Defaults to True.
+
+    Returns:
+        list of tuple: For each pair, the refined answer and its confidence score (0-100),
+                       followed by the attention weights if `attentions` is given.
+    """
+    # the answers of the whole batch are decoded and rendered at once
+    val_max = np.argmax(probabilities, axis=1)
+    accuracies = probabilities[np.arange(len(val_max)), val_max] * 100
+    answers = affine_answers(questions, [output_words[i] for i in val_max])
+    results = [(answer, float(accuracy)) for answer, accuracy in zip(answers, accuracies)]
+
+    if attentions is None:
+        return results
+
+    trimmed = []
+    for (story_tokens, question_tokens), result, attention in zip(entries, results, attentions):
+        # stories and questions are padded at the beginning
+        attention = attention[attention.shape[0] - min(len(story_tokens), attention.shape[0]):]
+        if flatten:
+            attention = attention[:, attention.shape[1] - min(len(question_tokens), attention.shape[1]):]
+        trimmed.append(result + (attention,))
+    return trimmed
+
+
+class InferenceSession:
+    """
+    Read-only snapshot of a trained `Chatbot` that many threads can query at once.
+
+    The session copies what inference needs from the chatbot (vocabulary, lengths and
+    weights) into a private network, so later changes of the chatbot (training, vocabulary
+    extension, `Model.load`) do not affect it. The vocabulary is exposed through read-only
+    views and the forward pass is a `tf.function` traced once at creation: calling a traced
+    graph is thread-safe and releases the GIL, unlike `keras.Model.predict`, so no lock
+    is needed around the session. The number of threads TensorFlow uses is set once per
+    process with `configure_threads`, before the model is loaded.
+
+    Attributes:
+        architecture (str): "flat" or "sentence".
+        word_indexes (MappingProxyType): Read-only mapping from the words to their indexes.
+        output_words (tuple of str): Word of each output of the network.
+    """
+
+    def __init__(self, chatbot):
+        """
+        Args:
+            chatbot (Chatbot): A trained (or loaded) chatbot.
+        """
+        self.architecture = chatbot.architecture
+        self.word_indexes = MappingProxyType(dict(chatbot.word_indexes))
+        self.output_words = tuple(chatbot.output_words)
+        self.__query_maxlength = chatbot.query_maxlength
+        if self.architecture == 'sentence':
+            self.__lengths = (chatbot.memory_size, chatbot.sentence_maxlength)
+        else:
+            self.__lengths = (chatbot.story_maxlength,)
+
+        # private copy of the answer + attention network, with its own variables
+        source = chatbot.get_inference_network()
+        network = clone_model(source)
+        network.set_weights(source.get_weights())
+        self.__network = network
+
+        signature = [tf.TensorSpec((None,) + self.__lengths, tf.int32),
+                     tf.TensorSpec((None, self.__query_maxlength), tf.int32)]
+        self.__forward = tf.function(lambda stories, queries: network([stories, queries], training=False),
+                                     input_signature=signature).get_concrete_function()
+
+    def vectorize(self, stories, questions):
+        """
+        Tokenizes and vectorizes story-question pairs with the vocabulary of the session.
+
+        Args:
+            stories (list of str): The stories.
+            questions (list of str): The questions, one per story.
+
+        Returns:
+            tuple: The samples (as given by `transform_entry`), the story and the query arrays.
+        """
+        flatten = self.architecture == 'flat'
+        entries = [transform_entry(story, question, flatten=flatten)[0] for story, question in zip(stories, questions)]
+        if flatten:
+            inputs, queries = vectorization(entries, self.word_indexes, *self.__lengths, self.__query_maxlength,
+                                            entry=True)
+        else:
+            inputs, queries = vectorization_sentences(entries, self.word_indexes, *self.__lengths,
+                                                      self.__query_maxlength, entry=True)
+        return entries, np.asarray(inputs, dtype=np.int32), np.asarray(queries, dtype=np.int32)
+
+    def forward(self, inputs, queries):
+        """
+        Runs the network on vectorized samples.
+
+        Args:
+            inputs (np.ndarray): Story arrays, as returned by `vectorize`.
+            queries (np.ndarray): Query arrays, as returned by `vectorize`.
+
+        Returns:
+            tuple of np.ndarray: The answer distributions and the attention weights.
+        """
+        probabilities, attentions = self.__forward(tf.constant(inputs, tf.int32), tf.constant(queries, tf.int32))
+        return probabilities.numpy(), attentions.numpy()
+
+    def predict_batch(self, stories, questions, return_attention=False):
+        """
+        Predicts the answers of several story-question pairs, like `Chatbot.predict_batch`.
+
+        Args:
+            stories (list of str): The stories.
+            questions (list of str): The questions, one per story.
+            return_attention (bool, optional): Also return the attention weights of each pair,
+                                               trimmed to the actual story. Defaults to False.
+
+        Returns:
+            list of tuple: For each pair, the refined answer and its confidence score (0-100),
+                           followed by the attention weights if `return_attention` is True.
+        """
+        entries, inputs, queries = self.vectorize(stories, questions)
+        probabilities, attentions = self.forward(inputs, queries)
+        return format_predictions(entries, questions, probabilities, self.output_words,
+                                  attentions if return_attention else None, self.architecture == 'flat')
+
+    def predict(self, story, question, return_attention=False):
+        """
+        Predicts the answer of one story-question pair (see `predict_batch`).
+
+        Args:
+            story (str): The story.
+            question (str): The question.
+            return_attention (bool, optional): Also return the attention weights. Defaults to False.
+
+        Returns:
+            tuple: The refined answer and its confidence score (0-100), and the attention if requested.
+        """
+        return self.predict_batch([story], [question], return_attention=return_attention)[0]
+
+
+def main():
+    """Command line entry point: answers the test set from several threads sharing one session."""
+    parser = argparse.ArgumentParser(description="Multi-threaded inference with a Story Bot model.")
+    parser.add_argument('--dataset', default="../Data/{}.txt", help="format string of the dataset files")
+    parser.add_argument('--model', default="../Network", help="directory of the model registry")
+    parser.add_argument('--tag', default=None, help="tag or name of the model (default: latest)")
+    parser.add_argument('--threads', type=int, default=4, help="number of client threads")
+    parser.add_argument('--batch-size', type=int, default=32, help="pairs per request")
+    parser.add_argument('--intra-op-threads', type=int, default=None, help="TensorFlow threads per operation")
+    parser.add_argument('--inter-op-threads', type=int, default=None, help="TensorFlow operations run in parallel")
+    args = parser.parse_args()
+
+    # the thread counts can only be set before any model is built
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+
+    # imported here: `Model` depends on this module through `Chatbot`
+    from Model import Model
+
+    chatbot = Model(args.dataset, args.model, tag=args.tag).chatbot
+    session = chatbot.inference_session()
+
+    records = list(chatbot.test)
+    requests = [([r.story_text() for r in records[i:i + args.batch_size]],
+                 [r.question_text() for r in records[i:i + args.batch_size]])
+                for i in range(0, len(records), args.batch_size)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        answered = sum(len(results) for results in pool.map(lambda request: session.predict_batch(*request), requests))
+    elapsed = time.perf_counter() - start
+    print(f"{answered} questions answered by {args.threads} threads in {elapsed:.2f}s "
+          f"({answered / elapsed:.1f} questions/s)")
+
+
+if __name__ == '__main__':
+    main()
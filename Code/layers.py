@@ -0,0 +1,202 @@
+import numpy as np
+from tensorflow.keras import constraints, ops
+from tensorflow.keras.constraints import Constraint
+from tensorflow.keras.layers import Layer
+from tensorflow.keras.saving import register_keras_serializable
+
+
+def position_encoding(sentence_length, embedding_dim):
+    """
+    Computes the position encoding matrix of "End-To-End Memory Networks" (section 4.1).
+
+    The weight of the k-th embedding dimension of the j-th word of a sentence is
+    l_kj = (1 - j/J) - (k/d)(1 - 2j/J), with J the sentence length and d the embedding size,
+    so that the sum over the words keeps track of their order in the sentence.
+
+    Args:
+        sentence_length (int): Number of words per sentence (J).
+        embedding_dim (int): Size of the word embeddings (d).
+
+    Returns:
+        np.ndarray: A float32 matrix of shape (sentence_length, embedding_dim).
+    """
+    j = np.arange(1, sentence_length + 1, dtype='float32')[:, None] / sentence_length
+    k = np.arange(1, embedding_dim + 1, dtype='float32')[None, :] / embedding_dim
+    return (1 - j) - k * (1 - 2 * j)
+
+
+@register_keras_serializable(package='story_bot')
+class PositionEncoding(Layer):
+    """
+    Keras layer encoding each sentence of embedded words into a single vector.
+
+    The input is a tensor of shape (..., sentence_length, embedding_dim); the words are
+    weighted by the position encoding matrix and summed, giving a tensor of shape
+    (..., embedding_dim). Applied on a story of shape (batch, memory_size, sentence_length,
+    embedding_dim), it produces one memory slot per sentence.
+    """
+
+    def build(self, input_shape):
+        """
+        Creates the constant position encoding matrix for the input sentence length.
+
+        Args:
+            input_shape (tuple): Shape of the embedded sentences.
+        """
+        self.encoding = ops.convert_to_tensor(position_encoding(input_shape[-2], input_shape[-1]))
+        super().build(input_shape)
+
+    def call(self, inputs):
+        """
+        Weights every word by its position and sums the words of each sentence.
+
+        Args:
+            inputs (Tensor): Embedded sentences of shape (..., sentence_length, embedding_dim).
+
+        Returns:
+            Tensor: Encoded sentences of shape (..., embedding_dim).
+        """
+        return ops.sum(inputs * self.encoding, axis=-2)
+
+    def compute_output_shape(self, input_shape):
+        """
+        Removes the word axis from the input shape.
+
+        Args:
+            input_shape (tuple): Shape of the embedded sentences.
+
+        Returns:
+            tuple: Shape of the encoded sentences.
+        """
+        return tuple(input_shape[:-2]) + (input_shape[-1],)
+
+
+@register_keras_serializable(package='story_bot')
+class NilEmbedding(Constraint):
+    """
+    Embedding constraint keeping the vector of the padding index 0 at zero.
+
+    Padding words then add nothing to the position-encoded sentence vectors, and empty
+    memory slots are zero vectors (the nil word of "End-To-End Memory Networks").
+    """
+
+    def __call__(self, w):
+        return ops.concatenate([ops.zeros_like(w[:1]), w[1:]], axis=0)
+
+
+@register_keras_serializable(package='story_bot')
+class SlotAttention(Layer):
+    """
+    Softmax over the memory slots that ignores the empty ones.
+
+    The inputs are the attention logits of shape (batch, memory_size) and the story of
+    shape (batch, memory_size, sentence_length); the slots without any word get a large
+    negative logit, so that the padding never takes attention from the real sentences.
+    """
+
+    def call(self, inputs):
+        """
+        Args:
+            inputs (list of Tensor): The logits and the story token ids.
+
+        Returns:
+            Tensor: The attention weights of shape (batch, memory_size).
+        """
+        logits, sentences = inputs
+        filled = ops.any(ops.not_equal(sentences, 0), axis=-1)
+        return ops.softmax(ops.where(filled, logits, -1e9), axis=-1)
+
+
+@register_keras_serializable(package='story_bot')
+class SharedEmbedding(Layer):
+    """
+    Embedding table that can be shared between several inputs and the output layer.
+
+    Called on token ids, the layer looks up their embeddings like `Embedding`. Called with
+    `reverse=True` on vectors of size `output_dim`, it projects them back onto the
+    vocabulary with the transposed table, which ties the output layer to the embedding
+    (as in the weight tying of "End-To-End Memory Networks", section 2.2). All the calls
+    are nodes of the same layer, so the tying survives the JSON serialization of the model.
+    """
+
+    def __init__(self, input_dim, output_dim, embeddings_constraint=None, **kwargs):
+        """
+        Args:
+            input_dim (int): Size of the vocabulary (including padding).
+            output_dim (int): Size of the embeddings.
+            embeddings_constraint (Constraint, optional): Constraint of the table (e.g. `NilEmbedding`).
+                                                          Defaults to None.
+        """
+        super().__init__(**kwargs)
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.embeddings_constraint = constraints.get(embeddings_constraint)
+
+    def build(self, input_shape):
+        """
+        Creates the embedding table, whose shape does not depend on the input.
+
+        Args:
+            input_shape (tuple): Shape of the first input.
+        """
+        self.embeddings = self.add_weight(shape=(self.input_dim, self.output_dim), initializer='uniform',
+                                          constraint=self.embeddings_constraint, name='embeddings')
+        super().build(input_shape)
+
+    def call(self, inputs, reverse=False):
+        """
+        Looks up the embeddings of token ids, or scores vectors against every embedding.
+
+        Args:
+            inputs (Tensor): Token ids, or vectors of shape (..., output_dim) if `reverse`.
+            reverse (bool, optional): Project onto the vocabulary. Defaults to False.
+
+        Returns:
+            Tensor: Embeddings of shape (..., output_dim), or logits of shape (..., input_dim) if `reverse`.
+        """
+        if reverse:
+            return ops.matmul(inputs, ops.transpose(self.embeddings))
+        return ops.take(self.embeddings, ops.cast(inputs, 'int32'), axis=0)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'input_dim': self.input_dim, 'output_dim': self.output_dim,
+                       'embeddings_constraint': constraints.serialize(self.embeddings_constraint)})
+        return config
+
+
+@register_keras_serializable(package='story_bot')
+class EnsembleCombine(Layer):
+    """
+    Keras layer combining the answer distributions of the members of an ensemble.
+
+    The input is the list of the distributions of shape (batch, outputs) given by each
+    member. With "average", the output is their mean; with "vote", the output is the
+    share of the members whose best answer is each output (ties go to the first output).
+    """
+
+    def __init__(self, method='average', **kwargs):
+        """
+        Args:
+            method (str, optional): "average" or "vote". Defaults to "average".
+        """
+        super().__init__(**kwargs)
+        self.method = method
+
+    def call(self, inputs):
+        """
+        Args:
+            inputs (list of Tensor): Distributions of shape (batch, outputs), one per member.
+
+        Returns:
+            Tensor: The combined distribution of shape (batch, outputs).
+        """
+        stacked = ops.stack(inputs, axis=0)
+        if self.method == 'vote':
+            stacked = ops.one_hot(ops.argmax(stacked, axis=-1), stacked.shape[-1])
+        return ops.mean(stacked, axis=0)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({'method': self.method})
+        return config
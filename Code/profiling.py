@@ -0,0 +1,195 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from tensorflow.keras.callbacks import Callback
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the process so far.
+
+    Returns:
+        int or None: The peak RSS in bytes, or None if the platform does not report it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageProfiler:
+    """
+    Records the resources used by each stage of the training pipeline.
+
+    For every stage the profiler stores the wall time, the CPU time of the process, the
+    peak RSS of the process at the end of the stage (and how much the stage raised it) and,
+    if enabled, the peak of Python allocations during the stage traced by `tracemalloc`.
+
+    Attributes:
+        records (list of dict): One record per completed stage, in order.
+        trace_allocations (bool): Whether Python allocations are traced (slower).
+    """
+    records = None
+    trace_allocations = None
+
+    def __init__(self, trace_allocations=True):
+        """
+        Args:
+            trace_allocations (bool, optional): Trace Python allocations with `tracemalloc`. Defaults to True.
+        """
+        self.records = []
+        self.trace_allocations = trace_allocations
+        self.__current = None
+
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self, name):
+        """
+        Starts a stage, ending the current one if any.
+
+        Args:
+            name (str): Name of the stage.
+        """
+        if self.__current is not None:
+            self.stop()
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+        self.__current = (name, time.perf_counter(), time.process_time(), peak_rss())
+
+    def stop(self):
+        """
+        Ends the current stage and records its measures.
+
+        Returns:
+            dict: The record of the stage.
+        """
+        name, wall, cpu, rss_before = self.__current
+        self.__current = None
+
+        rss = peak_rss()
+        record = {'stage': name,
+                  'wall_time': time.perf_counter() - wall,
+                  'cpu_time': time.process_time() - cpu,
+                  'peak_rss': rss,
+                  'peak_rss_increase': rss - rss_before if rss is not None else None,
+                  'peak_traced': tracemalloc.get_traced_memory()[1] if self.trace_allocations else None}
+        self.records.append(record)
+        return record
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profiles the enclosed block as a stage.
+
+        Args:
+            name (str): Name of the stage.
+        """
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def to_json(self, url):
+        """
+        Writes the records to a JSON file.
+
+        Args:
+            url (str): Path of the file.
+        """
+        with open(url, 'w', encoding='utf-8') as f:
+            json.dump(self.records, f, indent=2)
+
+    def format_table(self):
+        """
+        Formats the records as a readable table (times in seconds, memory in MiB).
+
+        Returns:
+            str: The table.
+        """
+        def mib(value):
+            return f"{value / 2 ** 20:.1f}" if value is not None else '-'
+
+        lines = [f"{'Stage':<24}{'Wall (s)':>10}{'CPU (s)':>10}{'Peak RSS':>10}{'RSS +':>10}{'Traced':>10}"]
+        for r in self.records:
+            lines.append(f"{r['stage']:<24}{r['wall_time']:>10.3f}{r['cpu_time']:>10.3f}{mib(r['peak_rss']):>10}"
+                         f"{mib(r['peak_rss_increase']):>10}{mib(r['peak_traced']):>10}")
+        return '\n'.join(lines)
+
+
+class EpochProfiler(Callback):
+    """
+    Keras callback recording every training epoch as a stage of a `StageProfiler`.
+    """
+
+    def __init__(self, profiler):
+        """
+        Args:
+            profiler (StageProfiler): The profiler receiving the epochs.
+        """
+        super().__init__()
+        self.profiler = profiler
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.profiler.start(f"epoch {epoch + 1}")
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.profiler.stop()
+
+
+@contextmanager
+def tensorflow_trace(logdir):
+    """
+    Runs the enclosed block under the TensorFlow profiler (viewable in TensorBoard).
+
+    Args:
+        logdir (str or None): Directory of the trace; None disables the profiler.
+    """
+    if logdir is None:
+        yield
+        return
+
+    import tensorflow as tf
+
+    tf.profiler.experimental.start(logdir)
+    try:
+        yield
+    finally:
+        tf.profiler.experimental.stop()
+
+
+def main():
+    """Command line entry point: profiles the construction and the training of a chatbot."""
+    parser = argparse.ArgumentParser(description="Profile the Story Bot training pipeline.")
+    parser.add_argument('--dataset', default="../Data/{}.txt", help="format string of the dataset files")
+    parser.add_argument('--architecture', default='flat', choices=('flat', 'sentence'), help="network architecture")
+    parser.add_argument('--epochs', type=int, default=3, help="number of training epochs")
+    parser.add_argument('--json', default=None, help="write the report to this JSON file")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="do not trace Python allocations")
+    parser.add_argument('--tf-profile', default=None, help="directory of a TensorFlow profiler trace of the fit loop")
+    args = parser.parse_args()
+
+    # imported here so that the profiler module can be used without building a chatbot
+    from Chatbot import Chatbot
+
+    profiler = StageProfiler(trace_allocations=not args.no_tracemalloc)
+    chatbot = Chatbot(args.dataset, architecture=args.architecture, profiler=profiler)
+    chatbot.train_model(epochs=args.epochs, tf_profile_dir=args.tf_profile)
+
+    print(profiler.format_table())
+    if args.json:
+        profiler.to_json(args.json)
+
+
+if __name__ == '__main__':
+    main()
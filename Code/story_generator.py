@@ -0,0 +1,304 @@
+import argparse
+import random
+
+NAMES = ['Mary', 'John', 'Daniel', 'Sandra']
+# the "why" stories of the bundled files have their own people
+WHY_NAMES = ['Sumit', 'Yann', 'Antoine', 'Jason']
+LOCATIONS = ['bathroom', 'bedroom', 'garden', 'hallway', 'kitchen', 'office']
+OBJECTS = ['apple', 'football', 'milk', 'pajamas']
+MOTIVES = {'hungry': 'kitchen', 'thirsty': 'kitchen', 'tired': 'bedroom', 'bored': 'garden'}
+
+MOVE_VERBS = ['went to', 'journeyed to', 'travelled to', 'went back to', 'moved to']
+GET_VERBS = ['took', 'picked up', 'grabbed', 'got']
+OPPOSITE_DIRECTIONS = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
+
+SYLLABLES = ['ba', 'ko', 'ri', 'mu', 'te', 'lo', 'sa', 'vi', 'ne', 'du', 'fa', 'gi']
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def synthetic_words(count, start):
+    """
+    Generates distinct pronounceable words, used to grow the vocabulary beyond the bAbI one.
+
+    The i-th word is the base-12 writing of `start + i` with syllables as digits, so two
+    calls with disjoint ranges never produce the same word.
+
+    Args:
+        count (int): Number of words.
+        start (int): Index of the first word.
+
+    Returns:
+        list of str: The words (at least two syllables each).
+    """
+    words = []
+    for index in range(start, start + count):
+        syllables = []
+        while index or len(syllables) < 2:
+            index, digit = divmod(index, len(SYLLABLES))
+            syllables.append(SYLLABLES[digit])
+        words.append(''.join(reversed(syllables)))
+    return words
+
+
+def parse_size(text):
+    """
+    Parses a size such as "500M" or "2G" into bytes.
+
+    Args:
+        text (str): A number of bytes, optionally followed by K, M or G.
+
+    Returns:
+        int: The size in bytes.
+    """
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+class StoryGenerator:
+    """
+    Generator of synthetic stories in the bAbI format parsed by `extract_stories`.
+
+    Three kinds of stories are produced, as in the bundled dataset:
+        - "where": people moving between locations, then "Where is <name>?".
+        - "what": relative positions of locations, then "What is north of the <location>?".
+        - "why": motivations ("<name> is tired.") with "Where will <name> go?" and
+          "Why did <name> go to the <location>?".
+
+    Lines are numbered from 1 in each story and questions carry their answer and the id
+    of the supporting line, separated by tabulations (after a space for the "where"
+    questions, like in the bundled files). Everything is drawn from a seeded
+    random generator, so a given configuration always produces the same file.
+
+    Attributes:
+        names (list of str): People of the "where" stories.
+        why_names (list of str): People of the "why" stories.
+        locations (list of str): Locations of the stories.
+        objects (list of str): Objects people can get.
+        motives (dict): Motivation -> location where it leads.
+        question_mix (dict): Story kind -> relative frequency.
+        min_facts (int): Minimum number of fact sentences per story.
+        max_facts (int): Maximum number of fact sentences per story.
+        question_every (int): Number of facts between two questions.
+    """
+
+    def __init__(self, seed=0, names_nb=len(NAMES), locations_nb=len(LOCATIONS), objects_nb=len(OBJECTS),
+                 motives_nb=len(MOTIVES), min_facts=2, max_facts=10, question_every=2, question_mix=None):
+        """
+        Initializes the generator and its vocabulary.
+
+        The bAbI words are used first; larger counts are completed with synthetic words.
+
+        Args:
+            seed (int, optional): Seed of the random generator. Defaults to 0.
+            names_nb (int, optional): Number of people of the "where" stories, and of the "why"
+                                      ones. Defaults to 4.
+            locations_nb (int, optional): Number of locations (at least 2). Defaults to 6.
+            objects_nb (int, optional): Number of objects. Defaults to 4.
+            motives_nb (int, optional): Number of motivations. Defaults to 4.
+            min_facts (int, optional): Minimum number of facts per story. Defaults to 2.
+            max_facts (int, optional): Maximum number of facts per story. Defaults to 10.
+            question_every (int, optional): Number of facts between two questions. Defaults to 2.
+            question_mix (dict, optional): Relative frequency of the "where", "what" and "why"
+                                           stories. Defaults to the mix of the bundled training set.
+
+        Raises:
+            ValueError: If there are fewer than two locations, no fact between two questions
+                        or the mix is invalid.
+        """
+        if locations_nb < 2:
+            raise ValueError("At least two locations are needed")
+        if question_every < 1:
+            raise ValueError("At least one fact is needed between two questions")
+
+        self.random = random.Random(seed)
+
+        # synthetic words are numbered globally so that categories never share a word
+        counter = 0
+
+        def vocabulary(base, count):
+            nonlocal counter
+            extra = synthetic_words(max(0, count - len(base)), counter)
+            counter += len(extra)
+            return list(base[:count]) + extra
+
+        self.names = [name.capitalize() for name in vocabulary(NAMES, names_nb)]
+        self.locations = vocabulary(LOCATIONS, locations_nb)
+        self.objects = vocabulary(OBJECTS, objects_nb)
+        # synthetic motives, or bAbI ones whose location was not kept, lead to a drawn location
+        self.motives = {motive: MOTIVES[motive] if MOTIVES.get(motive) in self.locations
+                        else self.random.choice(self.locations)
+                        for motive in vocabulary(list(MOTIVES), motives_nb)}
+        self.why_names = [name.capitalize() for name in vocabulary(WHY_NAMES, names_nb)]
+
+        self.question_mix = question_mix or {'where': 10375, 'what': 1000, 'why': 625}
+        if not any(self.question_mix.values()) or set(self.question_mix) - {'where', 'what', 'why'}:
+            raise ValueError(f"Invalid question mix: {self.question_mix}")
+
+        self.min_facts = min_facts
+        self.max_facts = max_facts
+        self.question_every = question_every
+
+    def generate_story(self):
+        """
+        Generates one story, whose kind is drawn according to the question mix.
+
+        Returns:
+            list of str: The numbered lines of the story (without line breaks).
+        """
+        kinds, weights = zip(*self.question_mix.items())
+        kind = self.random.choices(kinds, weights)[0]
+        facts_nb = self.random.randint(self.min_facts, self.max_facts)
+        events = getattr(self, f"_{kind}_events")(facts_nb)
+
+        # number the lines and resolve the supporting fact references; as in the bundled files,
+        # only the "Where is" questions have a space before their answer
+        separator = ' \t' if kind == 'where' else '\t'
+        lines = []
+        ids = {}
+        for key, text, answer, support in events:
+            line_id = len(lines) + 1
+            if answer is None:
+                ids[key] = line_id
+                lines.append(f"{line_id} {text}")
+            else:
+                lines.append(f"{line_id} {text}{separator}{answer}\t{ids[support]}")
+        return lines
+
+    def _where_events(self, facts_nb):
+        """Movements of people, with a question about a moved person every `question_every` facts."""
+        events = []
+        positions = {}
+        people = self.random.sample(self.names, min(len(self.names), max(2, facts_nb // 2)))
+        for i in range(facts_nb):
+            name = self.random.choice(people)
+            location = self.random.choice(self.locations)
+            positions[name] = (location, i)
+            events.append((i, f"{name} {self.random.choice(MOVE_VERBS)} the {location}.", None, None))
+
+            if (i + 1) % self.question_every == 0:
+                name = self.random.choice(list(positions))
+                location, support = positions[name]
+                events.append((None, f"Where is {name}?", location, support))
+        return events
+
+    def _what_events(self, facts_nb):
+        """Relative positions of locations, asked in both directions, without contradictions."""
+        events = []
+        facts = []
+        # (direction, location) pairs that already have an answer
+        answered = set()
+        for i in range(facts_nb):
+            for _ in range(10):
+                first, second = self.random.sample(self.locations, 2)
+                direction = self.random.choice(list(OPPOSITE_DIRECTIONS))
+                opposite = OPPOSITE_DIRECTIONS[direction]
+                keys = {(direction, second), (opposite, first)}
+                if not keys & answered:
+                    break
+            else:
+                break
+
+            answered |= keys
+            facts.append((i, first, direction, second))
+            events.append((i, f"The {first} is {direction} of the {second}.", None, None))
+
+            if (i + 1) % self.question_every == 0:
+                support, first, direction, second = self.random.choice(facts)
+                if self.random.random() < 0.5:
+                    events.append((None, f"What is {direction} of the {second}?", first, support))
+                else:
+                    events.append((None, f"What is the {first} {direction} of?", second, support))
+        return events
+
+    def _why_events(self, facts_nb):
+        """Motivations of people, each followed by a move and the get of an object, interleaved."""
+        people = self.random.sample(self.why_names, min(len(self.why_names), max(1, facts_nb // 3)))
+        stories = []
+        for name in people:
+            motive = self.random.choice(list(self.motives))
+            location = self.motives[motive]
+            lower = name.lower()
+            item = self.random.choice(self.objects)
+            stories.append([
+                (name, f"{name} is {motive}.", None, None),
+                (None, f"Where will {lower} go?", location, name),
+                (None, f"{name} {self.random.choice(MOVE_VERBS)} the {location}.", None, None),
+                (None, f"Why did {lower} go to the {location}?", motive, name),
+                (None, f"{name} {self.random.choice(GET_VERBS)} the {item} there.", None, None),
+                (None, f"Why did {lower} get the {item}?", motive, name),
+            ])
+
+        # interleave the people while keeping the order of each one's events
+        events = []
+        while stories:
+            story = self.random.choice(stories)
+            events.append(story.pop(0))
+            if not story:
+                stories.remove(story)
+        return events
+
+    def write(self, url, size=None, stories_nb=None):
+        """
+        Streams generated stories to a file until a size or a number of stories is reached.
+
+        Only one story is held in memory at a time, so the memory used does not depend on
+        the size of the file.
+
+        Args:
+            url (str): Path of the file to write.
+            size (int, optional): Minimum number of bytes to write. Defaults to None.
+            stories_nb (int, optional): Number of stories to write. Defaults to None.
+
+        Returns:
+            tuple: The number of stories and of bytes written.
+
+        Raises:
+            ValueError: If neither a size nor a number of stories is given.
+        """
+        if size is None and stories_nb is None:
+            raise ValueError("A size or a number of stories is required")
+
+        written = stories = 0
+        with open(url, 'w', encoding='utf-8', newline='\n', buffering=1024 * 1024) as f:
+            while (size is None or written < size) and (stories_nb is None or stories < stories_nb):
+                text = '\n'.join(self.generate_story()) + '\n'
+                f.write(text)
+                written += len(text.encode('utf-8'))
+                stories += 1
+        return stories, written
+
+
+def main():
+    """Command line entry point of the generator."""
+    parser = argparse.ArgumentParser(description="Generate synthetic stories in the bAbI format.")
+    parser.add_argument('output', help="file to write")
+    parser.add_argument('--size', default=None, help="minimum size of the file (e.g. 500M, 2G)")
+    parser.add_argument('--stories', type=int, default=None, help="number of stories")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random generator")
+    parser.add_argument('--names', type=int, default=len(NAMES), help="number of people of each story kind")
+    parser.add_argument('--locations', type=int, default=len(LOCATIONS), help="number of locations")
+    parser.add_argument('--objects', type=int, default=len(OBJECTS), help="number of objects")
+    parser.add_argument('--motives', type=int, default=len(MOTIVES), help="number of motivations")
+    parser.add_argument('--min-facts', type=int, default=2, help="minimum number of facts per story")
+    parser.add_argument('--max-facts', type=int, default=10, help="maximum number of facts per story")
+    parser.add_argument('--question-every', type=int, default=2, help="number of facts between two questions")
+    parser.add_argument('--mix', default=None, help="frequency of each story kind, e.g. where=8,what=1,why=1")
+    args = parser.parse_args()
+    if args.question_every < 1:
+        parser.error("--question-every must be at least 1")
+
+    mix = None
+    if args.mix:
+        mix = {kind: float(weight) for kind, weight in (item.split('=') for item in args.mix.split(','))}
+
+    generator = StoryGenerator(args.seed, args.names, args.locations, args.objects, args.motives,
+                               args.min_facts, args.max_facts, args.question_every, mix)
+    stories, written = generator.write(args.output, parse_size(args.size) if args.size else None, args.stories)
+    print(f"{stories} stories, {written} bytes written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()